@@ -4,14 +4,28 @@ from datetime import timedelta
 import logging
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_DEVICE_ID, CONF_EMAIL, CONF_PASSWORD, Platform
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
-
-from .const import DOMAIN, REFRESH_INTERVAL_MINUTES
-from .data_handler import EbecoApi
-from .ebeco_device import EbecoDevice
+from homeassistant.const import CONF_DEVICE_ID, CONF_DEVICES, CONF_EMAIL, Platform
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.typing import ConfigType
+
+from .account import async_get_registry
+from .const import (
+    CONF_ADD_NEW_DEVICES,
+    CONF_EXCLUDED_DEVICES,
+    CONF_MAX_REFRESH_INTERVAL,
+    CONF_REQUEST_DEADLINE,
+    CONF_STALE_WINDOW,
+    DEFAULT_MAX_REFRESH_INTERVAL_MINUTES,
+    DEFAULT_REQUEST_DEADLINE_SECONDS,
+    DEFAULT_STALE_WINDOW_MINUTES,
+    DOMAIN,
+    SIGNAL_NEW_DEVICES,
+)
+from .coordinator import EbecoCoordinator
+from .services import async_setup_services
 
 PLATFORMS = [
     Platform.CLIMATE,
@@ -20,57 +34,203 @@ PLATFORMS = [
 
 _LOGGER = logging.getLogger(__name__)
 
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the services of the integration."""
+    async_setup_services(hass)
+    return True
+
+
+@callback
+def async_get_account_api(hass: HomeAssistant, username: str, password: str):
+    """Return the client already set up for an account, if there is one.
+
+    Reusing it lets e.g. discovery in the config flow share the token and
+    request budget of the account.
+    """
+    account = async_get_registry(hass).async_get(username)
+    if account is None or account.api.password != password:
+        return None
+    return account.api
+
+
+def _entry_device_ids(entry: ConfigEntry) -> list[str]:
+    """Return the ids of the devices of an entry.
+
+    Entries created before an entry could hold several devices have a single
+    CONF_DEVICE_ID instead of CONF_DEVICES.
+    """
+    if CONF_DEVICES in entry.data:
+        return [str(device_id) for device_id in entry.data[CONF_DEVICES]]
+    return [str(entry.data[CONF_DEVICE_ID])]
+
+
+@callback
+def async_configured_device_ids(
+    hass: HomeAssistant, exclude_entry_id: str | None = None
+) -> set[str]:
+    """Return the ids of the devices set up by any entry but the excluded one."""
+    return {
+        device_id
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if entry.entry_id != exclude_entry_id
+        for device_id in _entry_device_ids(entry)
+    }
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
-    """Set up the thermostat."""
-    username = entry.data[CONF_EMAIL]
-    password = entry.data[CONF_PASSWORD]
-    device_id = entry.data[CONF_DEVICE_ID]
 
-    device = EbecoDevice(
-        device_id,
-        EbecoApi(username, password, websession=async_get_clientsession(hass)),
+@callback
+def async_account_entries(hass: HomeAssistant, email: str) -> list[ConfigEntry]:
+    """Return the entries of an account, which share its polling options."""
+    registry = async_get_registry(hass)
+    key = registry.key(email)
+    return [
+        entry
+        for entry in hass.config_entries.async_entries(DOMAIN)
+        if registry.key(entry.data[CONF_EMAIL]) == key
+    ]
+
+
+# The options flow stores the options of an account in all of its entries.
+# Entries that were configured apart before are merged, with the shortest
+# interval and the longest deadline and stale window of any of them.
+
+
+def _max_refresh_interval(entries: list[ConfigEntry]) -> timedelta:
+    return timedelta(
+        minutes=min(
+            entry.options.get(
+                CONF_MAX_REFRESH_INTERVAL, DEFAULT_MAX_REFRESH_INTERVAL_MINUTES
+            )
+            for entry in entries
+        )
     )
 
-    async def async_get():
-        _LOGGER.debug("Attempting to fetch new data from Ebeco API")
-        try:
-            data = await device.async_get()
-            _LOGGER.debug("Received data: %s", data)
-            return data
-        except Exception as err:
-            raise UpdateFailed(err) from err
-
-    coordinator = DataUpdateCoordinator(
-        hass,
-        _LOGGER,
-        name="Ebeco",
-        update_method=async_get,
-        update_interval=timedelta(minutes=REFRESH_INTERVAL_MINUTES),
+
+def _request_deadline(entries: list[ConfigEntry]) -> float:
+    return max(
+        entry.options.get(CONF_REQUEST_DEADLINE, DEFAULT_REQUEST_DEADLINE_SECONDS)
+        for entry in entries
     )
 
-    async def async_change(change):
+
+def _stale_window(entries: list[ConfigEntry]) -> timedelta:
+    return timedelta(
+        minutes=max(
+            entry.options.get(CONF_STALE_WINDOW, DEFAULT_STALE_WINDOW_MINUTES)
+            for entry in entries
+        )
+    )
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
+    """Set up the thermostat."""
+    registry = async_get_registry(hass)
+    entries = async_account_entries(hass, entry.data[CONF_EMAIL])
+    account = registry.async_acquire(
+        entry,
+        _max_refresh_interval(entries),
+        _request_deadline(entries),
+        _stale_window(entries),
+    )
+    coordinator = account.coordinator
+    _async_apply_options(coordinator, entries)
+
+    # All entries of an account share the coordinator, so only the first entry
+    # to get here has to wait for the initial fetch of every device, and only
+    # when there is no saved data to start from.
+    async with account.lock:
+        if coordinator.data is None and not await coordinator.async_load_snapshot():
+            await coordinator.async_refresh()
+
+    device_ids = _entry_device_ids(entry)
+    # Data kept through an outage of the API is good enough to set up with
+    if not coordinator.data_available or not any(
+        device_id in coordinator.data for device_id in device_ids
+    ):
+        await registry.async_release(entry)
+        if isinstance(coordinator.last_exception, ConfigEntryAuthFailed):
+            raise coordinator.last_exception
+        if not coordinator.data_available:
+            raise ConfigEntryNotReady(coordinator.last_exception)
+        raise ConfigEntryNotReady(
+            f"Devices {', '.join(device_ids)} not found on Ebeco account"
+        )
+    for device_id in device_ids:
+        if device_id not in coordinator.data:
+            _LOGGER.warning("Device %s not found on Ebeco account", device_id)
+
+    async def async_change(device_id, change):
+        device = coordinator.get_device(device_id)
         try:
             if await device.async_change(change):
                 data = await device.get_device()
-                coordinator.async_set_updated_data(data)
+                coordinator.async_note_write()
+                coordinator.async_set_device_data(device_id, data)
         except Exception:
             _LOGGER.exception("Failed to apply changes to thermostat")
             return False
 
-    await coordinator.async_config_entry_first_refresh()
-
-    hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = {
         "coordinator": coordinator,
         "async_change": async_change,
+        "device_ids": device_ids,
+        "account": account.key,
+        "api_metrics": account.metrics_entry == entry.entry_id,
     }
 
+    entry.async_on_unload(entry.add_update_listener(_async_update_options))
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    if entry.data.get(CONF_ADD_NEW_DEVICES):
+
+        @callback
+        def _async_add_new_devices() -> None:
+            """Add devices that showed up on the account to the entry."""
+            known = {
+                *device_ids,
+                *entry.data.get(CONF_EXCLUDED_DEVICES, ()),
+                *async_configured_device_ids(hass, entry.entry_id),
+            }
+            new_ids = [key for key in coordinator.data if key not in known]
+            if not new_ids:
+                return
+            _LOGGER.info("Adding new Ebeco devices %s", ", ".join(new_ids))
+            device_ids.extend(new_ids)
+            hass.config_entries.async_update_entry(
+                entry, data={**entry.data, CONF_DEVICES: list(device_ids)}
+            )
+            async_dispatcher_send(
+                hass, SIGNAL_NEW_DEVICES.format(entry.entry_id), new_ids
+            )
+
+        _async_add_new_devices()
+        entry.async_on_unload(coordinator.async_add_listener(_async_add_new_devices))
+
     return True
 
 
+async def _async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed options to the account the entry belongs to."""
+    _async_apply_options(
+        hass.data[DOMAIN][entry.entry_id]["coordinator"],
+        async_account_entries(hass, entry.data[CONF_EMAIL]),
+    )
+
+
+@callback
+def _async_apply_options(
+    coordinator: EbecoCoordinator, entries: list[ConfigEntry]
+) -> None:
+    coordinator.max_interval = max(
+        _max_refresh_interval(entries), coordinator.base_interval
+    )
+    coordinator.api.deadline = _request_deadline(entries)
+    coordinator.stale_window = _stale_window(entries)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Unload Ebeco Config."""
     _LOGGER.info("Unloading Ebeco component")
@@ -78,5 +238,11 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
 
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
+        await async_get_registry(hass).async_release(entry)
 
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the saved data of the account when its last entry is removed."""
+    await async_get_registry(hass).async_remove_storage(entry)
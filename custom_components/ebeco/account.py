@@ -0,0 +1,183 @@
+"""Share one Ebeco client between the config entries of an account."""
+
+import asyncio
+from datetime import timedelta
+import logging
+
+from aiohttp import ClientSession
+from aiohttp.hdrs import USER_AGENT
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_EMAIL, CONF_PASSWORD, EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import SERVER_SOFTWARE
+from homeassistant.helpers.storage import Store
+from homeassistant.util import slugify
+from homeassistant.util.ssl import get_default_context
+
+from .const import (
+    DATA_ACCOUNTS,
+    DOMAIN,
+    SNAPSHOT_STORAGE_VERSION,
+    TOKEN_STORAGE_VERSION,
+)
+from .coordinator import EbecoCoordinator
+from .data_handler import EbecoApi, create_websession
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EbecoAccount:
+    """Client and coordinator shared by every config entry of an account."""
+
+    def __init__(
+        self, key: str, coordinator: EbecoCoordinator, websession: ClientSession
+    ) -> None:
+        """Initialize the account."""
+        self.key = key
+        self.coordinator = coordinator
+        self.websession = websession
+        self.entries: set[str] = set()
+        # Held while the first refresh runs, so only one entry waits for it
+        self.lock = asyncio.Lock()
+        # The entry that shows the API metrics sensors of the account
+        self.metrics_entry: str | None = None
+
+    @property
+    def api(self) -> EbecoApi:
+        """Return the API client of the account."""
+        return self.coordinator.api
+
+    async def async_close(self) -> None:
+        """Stop polling and release the client."""
+        await self.coordinator.async_shutdown()
+        await self.api.async_close()
+        await self.websession.close()
+
+
+class EbecoAccountRegistry:
+    """Accounts in use, kept alive as long as one of their entries is loaded."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize the registry."""
+        self.hass = hass
+        self._accounts: dict[str, EbecoAccount] = {}
+        # Entries are not unloaded when Home Assistant stops, so the accounts
+        # still in use are closed here
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, self._async_close_all)
+
+    @staticmethod
+    def key(username: str) -> str:
+        """Return the key used to share a client between entries of an account."""
+        return username.strip().lower()
+
+    @callback
+    def async_get(self, username: str) -> EbecoAccount | None:
+        """Return the account of a username if an entry has set it up."""
+        return self._accounts.get(self.key(username))
+
+    @callback
+    def async_acquire(
+        self,
+        entry: ConfigEntry,
+        max_interval: timedelta,
+        deadline: float,
+        stale_window: timedelta,
+    ) -> EbecoAccount:
+        """Return the account of an entry, setting it up if needed."""
+        key = self.key(entry.data[CONF_EMAIL])
+        account = self._accounts.get(key)
+        if account is None:
+            account = self._accounts[key] = self._async_create(
+                key, entry, max_interval, deadline, stale_window
+            )
+        account.entries.add(entry.entry_id)
+        if account.metrics_entry is None:
+            account.metrics_entry = entry.entry_id
+        return account
+
+    async def async_release(self, entry: ConfigEntry) -> None:
+        """Drop the entry from its account and close it when no entry is left."""
+        key = self.key(entry.data[CONF_EMAIL])
+        account = self._accounts.get(key)
+        if account is None:
+            return
+
+        account.entries.discard(entry.entry_id)
+        if account.metrics_entry == entry.entry_id:
+            # Let the next entry that is set up show them instead
+            account.metrics_entry = None
+        if not account.entries:
+            _LOGGER.debug("Closing Ebeco account %s", key)
+            del self._accounts[key]
+            await account.async_close()
+
+    async def _async_close_all(self, event: Event) -> None:
+        """Close every account when Home Assistant stops."""
+        accounts = list(self._accounts.values())
+        self._accounts.clear()
+        await asyncio.gather(*(account.async_close() for account in accounts))
+
+    async def async_remove_storage(self, entry: ConfigEntry) -> None:
+        """Remove what is saved for the account of a removed entry.
+
+        Nothing is removed while another entry still uses the account.
+        """
+        key = self.key(entry.data[CONF_EMAIL])
+        if any(
+            self.key(other.data[CONF_EMAIL]) == key
+            for other in self.hass.config_entries.async_entries(DOMAIN)
+            if other.entry_id != entry.entry_id
+        ):
+            return
+        _LOGGER.debug("Removing saved data of Ebeco account %s", key)
+        await self._token_store(key).async_remove()
+        await self._snapshot_store(key).async_remove()
+
+    def _token_store(self, key: str) -> Store:
+        return Store(self.hass, TOKEN_STORAGE_VERSION, f"{DOMAIN}.token_{slugify(key)}")
+
+    def _snapshot_store(self, key: str) -> Store:
+        return Store(
+            self.hass, SNAPSHOT_STORAGE_VERSION, f"{DOMAIN}.devices_{slugify(key)}"
+        )
+
+    @callback
+    def _async_create(
+        self,
+        key: str,
+        entry: ConfigEntry,
+        max_interval: timedelta,
+        deadline: float,
+        stale_window: timedelta,
+    ) -> EbecoAccount:
+        # A dedicated connection pool keeps Ebeco traffic from competing with
+        # other integrations for connections
+        websession = create_websession(
+            get_default_context(), headers={USER_AGENT: SERVER_SOFTWARE}
+        )
+        api = EbecoApi(
+            entry.data[CONF_EMAIL],
+            entry.data[CONF_PASSWORD],
+            websession=websession,
+            token_store=self._token_store(key),
+            deadline=deadline,
+        )
+        coordinator = EbecoCoordinator(
+            self.hass,
+            api,
+            max_interval,
+            snapshot_store=self._snapshot_store(key),
+            stale_window=stale_window,
+        )
+        return EbecoAccount(key, coordinator, websession)
+
+
+@callback
+def async_get_registry(hass: HomeAssistant) -> EbecoAccountRegistry:
+    """Return the account registry of the integration."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    registry = domain_data.get(DATA_ACCOUNTS)
+    if registry is None:
+        registry = domain_data[DATA_ACCOUNTS] = EbecoAccountRegistry(hass)
+    return registry
@@ -0,0 +1,309 @@
+"""Record Ebeco API traffic to a cassette and replay it.
+
+A cassette is a file with one JSON object per line, one line for every
+response, or error, an ``EbecoApi`` got::
+
+    {"at": 1.52, "method": "GET", "url": "https://.../GetUserDevices/",
+     "path": "/services/app/Devices/GetUserDevices/", "request": null,
+     "status": 200, "elapsed": 0.21, "retry_after": null, "body": {...}}
+
+``at`` is the time in seconds since recording started and ``request`` the JSON
+body that was sent, e.g. the settings of a PUT. Credentials, tokens and
+personal details are redacted before anything is written.
+
+Pass an ``EbecoCassetteRecorder`` as ``recorder`` to ``EbecoApi`` to record,
+and an ``EbecoReplaySession`` as ``websession`` to replay. Kept free of Home
+Assistant imports so the scripts can use it on their own.
+"""
+
+import asyncio
+import base64
+from collections import defaultdict
+import json
+import time
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+REDACTED = "**REDACTED**"
+# Keys whose values are replaced by REDACTED wherever they appear in a body
+REDACT_KEYS = frozenset(
+    {
+        "accessToken",
+        "address",
+        "displayName",
+        "email",
+        "emailAddress",
+        "encryptedAccessToken",
+        "macAddress",
+        "name",
+        "password",
+        "refreshToken",
+        "userNameOrEmailAddress",
+    }
+)
+# Lines buffered before they are written to the cassette
+FLUSH_LINES = 100
+
+
+def redact(data):
+    """Return a copy of decoded JSON with sensitive values replaced."""
+    if isinstance(data, dict):
+        return {
+            key: REDACTED if key in REDACT_KEYS and value else redact(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [redact(value) for value in data]
+    return data
+
+
+def _path(url):
+    """Return the path and query of a URL, relative to the API."""
+    url = URL(str(url))
+    path = url.path
+    index = path.find("/api/")
+    if index != -1:
+        path = path[index + 4 :]
+    return f"{path}?{url.query_string}" if url.query_string else path
+
+
+class EbecoCassetteRecorder:
+    """Write the responses an EbecoApi gets to a cassette file.
+
+    Lines are buffered and written in an executor, so recording does not do
+    blocking I/O in the event loop. Call async_close to write what is left.
+    """
+
+    def __init__(self, path, flush_lines=FLUSH_LINES) -> None:
+        """Init the recorder, truncating the cassette file."""
+        self.path = path
+        self._flush_lines = flush_lines
+        self._started = time.monotonic()
+        self._lines = []
+        self._flush_task = None
+        with open(path, "w", encoding="utf-8"):
+            pass
+
+    def record(
+        self, method, url, status, elapsed, body=None, retry_after=None, request=None
+    ):
+        """Add a response, and the JSON sent for it, to the cassette."""
+        self._add(
+            method,
+            url,
+            elapsed,
+            request,
+            status=status,
+            body=body,
+            retry_after=retry_after,
+        )
+
+    def record_error(self, method, url, elapsed, timeout=False, request=None) -> None:
+        """Add a request that timed out or failed to connect to the cassette."""
+        self._add(
+            method, url, elapsed, request, error="timeout" if timeout else "client"
+        )
+
+    def _add(
+        self,
+        method,
+        url,
+        elapsed,
+        request,
+        status=None,
+        body=None,
+        retry_after=None,
+        error=None,
+    ) -> None:
+        if body is not None:
+            try:
+                body = redact(json.loads(body))
+            except ValueError:
+                body = None
+        self._lines.append(
+            json.dumps(
+                {
+                    "at": round(time.monotonic() - self._started - elapsed, 4),
+                    "method": method,
+                    "url": str(url),
+                    "path": _path(url),
+                    "request": None if request is None else redact(request),
+                    "status": status,
+                    "elapsed": round(elapsed, 4),
+                    "retry_after": retry_after,
+                    "error": error,
+                    "body": body,
+                },
+                separators=(",", ":"),
+            )
+        )
+        if len(self._lines) >= self._flush_lines and self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._async_flush())
+
+    async def async_close(self) -> None:
+        """Write every recorded line to the cassette."""
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._async_flush()
+
+    async def _async_flush(self) -> None:
+        try:
+            while self._lines:
+                lines, self._lines = self._lines, []
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._write, lines
+                )
+        finally:
+            self._flush_task = None
+
+    def _write(self, lines) -> None:
+        with open(self.path, "a", encoding="utf-8") as cassette:
+            cassette.write("\n".join(lines) + "\n")
+
+
+def load_cassette(path):
+    """Return the lines of a cassette as dicts."""
+    with open(path, encoding="utf-8") as cassette:
+        return [json.loads(line) for line in cassette if line.strip()]
+
+
+def _replay_token(ttl=86400):
+    """Return an unsigned token, as the recorded ones are redacted."""
+
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=")
+
+    payload = encode({"exp": int(time.time() + ttl)})
+    return b".".join((encode({"alg": "none"}), payload, b"replay")).decode()
+
+
+class _ReplayResponse:
+    """The parts of aiohttp.ClientResponse that EbecoApi uses."""
+
+    def __init__(self, method, url, status, body, retry_after) -> None:
+        self.method = method
+        self.url = URL(url)
+        self.status = status
+        self._body = body
+        headers = CIMultiDict()
+        if retry_after is not None:
+            headers["Retry-After"] = str(retry_after)
+        self.headers = CIMultiDictProxy(headers)
+        self.history = ()
+        self.request_info = aiohttp.RequestInfo(
+            self.url, method, CIMultiDictProxy(CIMultiDict()), self.url
+        )
+
+    async def read(self):
+        return self._body
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(
+                self.request_info, self.history, status=self.status
+            )
+
+
+class _ReplayRequest:
+    def __init__(self, session, method, url) -> None:
+        self._session = session
+        self._method = method
+        self._url = url
+
+    async def __aenter__(self):
+        return await self._session._async_respond(self._method, self._url)
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+
+class EbecoReplaySession:
+    """Stand in for the websession of an EbecoApi that replays a cassette.
+
+    Requests get the recorded responses for the same method and path, in
+    the order they were recorded, after the recorded time divided by speed.
+    With paced set, a response is instead held until the time it was recorded
+    at, counted from the first request and divided by speed, so the gaps
+    between requests are replayed as well. A recorded Retry-After is divided
+    by speed too.
+    When the responses of an endpoint run out they start over if loop is set,
+    otherwise the request fails with a connection error.
+    The redacted JSON bodies of the requests are kept in ``sent``, to compare
+    with the recorded ones.
+    """
+
+    def __init__(self, lines, speed=10.0, loop=True, paced=False) -> None:
+        """Init the session from the lines returned by load_cassette."""
+        self._speed = speed
+        self._loop = loop
+        self._paced = paced
+        self._started = None
+        # Time the recording took, added for each time the responses start over
+        self._duration = max(
+            (line["at"] + line["elapsed"] for line in lines), default=0
+        )
+        self._responses = defaultdict(list)
+        self._positions = defaultdict(int)
+        for line in lines:
+            self._responses[(line["method"], line["path"])].append(line)
+        self.requests = 0
+        self.sent = []
+        self.closed = False
+
+    def request(self, method, url, json=None, **kwargs):
+        """Replay a request."""
+        self.sent.append((method, _path(url), None if json is None else redact(json)))
+        return _ReplayRequest(self, method, url)
+
+    def post(self, url, json=None, **kwargs):
+        """Replay a POST request."""
+        return self.request("POST", url, json=json)
+
+    async def close(self) -> None:
+        """Close the session."""
+        self.closed = True
+
+    async def _async_respond(self, method, url):
+        self.requests += 1
+        key = (method, _path(url))
+        responses = self._responses.get(key)
+        position = self._positions[key]
+        if not responses or (position >= len(responses) and not self._loop):
+            raise aiohttp.ClientConnectionError(f"No recorded response for {key}")
+        line = responses[position % len(responses)]
+        self._positions[key] = position + 1
+
+        if self._speed and self._paced:
+            loop = asyncio.get_running_loop()
+            if self._started is None:
+                self._started = loop.time() - line["at"] / self._speed
+            due = (
+                line["at"]
+                + line["elapsed"]
+                + position // len(responses) * self._duration
+            )
+            await asyncio.sleep(max(self._started + due / self._speed - loop.time(), 0))
+        elif self._speed:
+            await asyncio.sleep(line["elapsed"] / self._speed)
+        if line["error"] == "timeout":
+            raise asyncio.TimeoutError
+        if line["error"] is not None:
+            raise aiohttp.ClientConnectionError("Recorded connection error")
+
+        retry_after = line["retry_after"]
+        if retry_after is not None:
+            # Throttling is sped up like the rest of the recording
+            retry_after = retry_after / self._speed if self._speed else 0
+        body = line["body"]
+        if key[1].endswith("/TokenAuth") and body is not None:
+            body = {**body, "result": {**body["result"]}}
+            body["result"]["accessToken"] = _replay_token()
+        return _ReplayResponse(
+            method,
+            url,
+            line["status"],
+            None if body is None else json.dumps(body).encode(),
+            retry_after,
+        )
@@ -11,14 +11,13 @@ from homeassistant.const import ATTR_TEMPERATURE, PRECISION_WHOLE, UnitOfTempera
 from homeassistant.core import HomeAssistant
 
 from .const import (
-    DOMAIN as EBECO_DOMAIN,
     MAIN_SENSOR,
     PRESET_MANUAL,
     PRESET_TIMER,
     PRESET_WEEK,
     EbecoClimateActions,
 )
-from .entity import EbecoEntity
+from .entity import EbecoEntity, async_setup_device_entities
 
 
 async def async_setup_entry(
@@ -26,20 +25,29 @@ async def async_setup_entry(
 ):
     """Set up Ebeco climate platform."""
 
-    instance = hass.data[EBECO_DOMAIN][config_entry.entry_id]
     sensor = config_entry.data[MAIN_SENSOR]
-    device_data = instance["coordinator"].data
-    dev = []
-    dev.append(EbecoClimateDevice(instance, device_data, sensor))
-    async_add_entities(dev)
+
+    def create_entities(instance, device_data):
+        return [EbecoClimateDevice(instance, device_data, sensor)]
+
+    async_setup_device_entities(hass, config_entry, async_add_entities, create_entities)
 
 
 class EbecoClimateDevice(EbecoEntity, ClimateEntity):
     """Ebeco climate device."""
 
+    _state_fields = (
+        "power_on",
+        "relay_on",
+        "selected_program",
+        "temperature_set",
+        "temperature_floor",
+        "temperature_room",
+    )
+
     def __init__(self, instance, device_data, main_sensor) -> None:
         """Initialize the thermostat."""
-        super().__init__(instance, device_data["id"], main_sensor)
+        super().__init__(instance, device_data.id, main_sensor)
         self.main_sensor = main_sensor
         self._enable_turn_on_off_backwards_compatibility = False
 
@@ -53,18 +61,18 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return f"{self._device['id']}"
+        return f"{self._device.id}"
 
     @property
     def name(self):
         """Return the name of the device, if any."""
-        return self._device["displayName"]
+        return self._device.display_name
 
     @property
     def hvac_action(self):
         """Return hvac action ie. the thermostat relay state."""
         if self.hvac_mode == HVACMode.HEAT:
-            if self._device["relayOn"]:
+            if self._device.relay_on:
                 return HVACAction.HEATING
             return HVACAction.IDLE
         else:
@@ -73,7 +81,7 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
     @property
     def hvac_mode(self):
         """Return hvac operation ie. heat, cool mode."""
-        if self._device["powerOn"]:
+        if self._device.power_on:
             return HVACMode.HEAT
         return HVACMode.OFF
 
@@ -109,20 +117,13 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
     def current_temperature(self):
         """Return the current temperature."""
         if self.main_sensor == "floor":
-            if "temperatureFloorDecimals" in self._device:
-                return self._device["temperatureFloorDecimals"]
-            else:
-                return self._device["temperatureFloor"]
-        else:
-            if "temperatureRoomDecimals" in self._device:
-                return self._device["temperatureRoomDecimals"]
-            else:
-                return self._device["temperatureRoom"]
+            return self._device.temperature_floor
+        return self._device.temperature_room
 
     @property
     def target_temperature(self):
         """Return the temperature we try to reach."""
-        return self._device["temperatureSet"]
+        return self._device.temperature_set
 
     @property
     def target_temperature_step(self):
@@ -132,17 +133,17 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
     @property
     def todays_on_minutes(self):
         """Return the number of minutes it has been running today."""
-        return self._device["todaysOnMinutes"]
+        return self._device.todays_on_minutes
 
     @property
     def installed_effect(self):
         """Return the installed effect in Watts."""
-        return self._device["installedEffect"]
+        return self._device.installed_effect
 
     @property
     def preset_mode(self):
         """Return preset mode."""
-        return self._device["selectedProgram"]
+        return self._device.selected_program
 
     @property
     def preset_modes(self):
@@ -154,7 +155,7 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
         if hvac_mode == HVACMode.HEAT:
             await self.async_change(
                 {
-                    "id": self._device["id"],
+                    "id": self._device.id,
                     "action": EbecoClimateActions.SET_POWERSTATE,
                     "state": True,
                 }
@@ -162,7 +163,7 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
         elif hvac_mode == HVACMode.OFF:
             await self.async_change(
                 {
-                    "id": self._device["id"],
+                    "id": self._device.id,
                     "action": EbecoClimateActions.SET_POWERSTATE,
                     "state": False,
                 }
@@ -177,7 +178,7 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
             return
         await self.async_change(
             {
-                "id": self._device["id"],
+                "id": self._device.id,
                 "action": EbecoClimateActions.SET_ROOM_TARGET_TEMPERATURE,
                 "temperature": temperature,
                 "heating_enabled": True,
@@ -188,7 +189,7 @@ class EbecoClimateDevice(EbecoEntity, ClimateEntity):
         """Set new preset to use."""
         await self.async_change(
             {
-                "id": self._device["id"],
+                "id": self._device.id,
                 "action": EbecoClimateActions.SET_PRESET_MODE,
                 "mode": preset_mode,
             }
@@ -5,11 +5,34 @@ from typing import Any, Optional
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.const import CONF_DEVICE_ID, CONF_DEVICES, CONF_EMAIL, CONF_PASSWORD
+from homeassistant.const import CONF_DEVICES, CONF_EMAIL, CONF_PASSWORD
+from homeassistant.core import callback
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+import homeassistant.helpers.config_validation as cv
 
-from .const import DOMAIN, MAIN_SENSOR
-from .data_handler import EbecoApi
+from . import (
+    async_account_entries,
+    async_configured_device_ids,
+    async_get_account_api,
+)
+from .account import async_get_registry
+from .const import (
+    CONF_ADD_NEW_DEVICES,
+    CONF_EXCLUDED_DEVICES,
+    CONF_MAX_REFRESH_INTERVAL,
+    CONF_REQUEST_DEADLINE,
+    CONF_STALE_WINDOW,
+    DEFAULT_MAX_REFRESH_INTERVAL_MINUTES,
+    DEFAULT_REQUEST_DEADLINE_SECONDS,
+    DEFAULT_STALE_WINDOW_MINUTES,
+    DOMAIN,
+    MAIN_SENSOR,
+    MAX_REQUEST_DEADLINE_SECONDS,
+    MAX_STALE_WINDOW_MINUTES,
+    MIN_REQUEST_DEADLINE_SECONDS,
+    REFRESH_INTERVAL_MINUTES,
+)
+from .data_handler import EbecoApi, EbecoAuthError, RequestPriority
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -27,6 +50,13 @@ class EbecoFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
     DOMAIN = DOMAIN
     data: Optional[dict[str, Any]]
+    _reauth_entry: Optional[config_entries.ConfigEntry] = None
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Get the options flow for this handler."""
+        return EbecoOptionsFlowHandler(config_entry)
 
     async def async_step_user(self, user_input=None):
         """Get configuration from the user."""
@@ -35,10 +65,14 @@ class EbecoFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
             email = user_input[CONF_EMAIL]
             password = user_input[CONF_PASSWORD]
 
+            shared_api = async_get_account_api(self.hass, email, password)
+            api = shared_api or EbecoApi(
+                email, password, async_get_clientsession(self.hass)
+            )
             try:
-                data = await EbecoApi(
-                    email, password, async_get_clientsession(self.hass)
-                ).fetch_user_devices()
+                data = await api.fetch_user_devices(priority=RequestPriority.DISCOVERY)
+            except EbecoAuthError:
+                errors["base"] = "invalid_auth"
             except Exception:
                 _LOGGER.warning(
                     "Unable to connect/authenticate with Ebeco API", exc_info=1
@@ -51,6 +85,9 @@ class EbecoFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
                     CONF_DEVICES: data,
                 }
                 return await self.async_step_pick_device()
+            finally:
+                if api is not shared_api:
+                    api.close()
 
         return self.async_show_form(
             step_id="user",
@@ -58,42 +95,170 @@ class EbecoFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
             errors=errors,
         )
 
-    async def async_step_pick_device(self, user_input=None):
-        """Get device selection from the user."""
+    async def async_step_reauth(self, entry_data):
+        """Ask for the password again after the Ebeco API rejected it."""
+        self._reauth_entry = self.hass.config_entries.async_get_entry(
+            self.context["entry_id"]
+        )
+        return await self.async_step_reauth_confirm()
+
+    async def async_step_reauth_confirm(self, user_input=None):
+        """Check the new password and hand it to every entry of the account."""
         errors = {}
+        email = self._reauth_entry.data[CONF_EMAIL]
         if user_input is not None:
-            device = user_input[CONF_DEVICE_ID]
-            main_sensor = user_input[MAIN_SENSOR]
+            password = user_input[CONF_PASSWORD]
+            api = EbecoApi(email, password, async_get_clientsession(self.hass))
+            try:
+                await api.fetch_user_devices(priority=RequestPriority.DISCOVERY)
+            except EbecoAuthError:
+                errors["base"] = "invalid_auth"
+            except Exception:
+                _LOGGER.warning("Unable to connect to Ebeco API", exc_info=1)
+                errors["base"] = "cannot_connect"
+            else:
+                for entry in async_account_entries(self.hass, email):
+                    self.hass.config_entries.async_update_entry(
+                        entry, data={**entry.data, CONF_PASSWORD: password}
+                    )
+                    if entry.state is not config_entries.ConfigEntryState.LOADED:
+                        self.hass.config_entries.async_schedule_reload(entry.entry_id)
+                account = async_get_registry(self.hass).async_get(email)
+                if account is not None:
+                    # Loaded entries keep the account, which polls again with
+                    # the new password
+                    account.api.password = password
+                    await account.coordinator.async_request_refresh()
+                return self.async_abort(reason="reauth_successful")
+            finally:
+                api.close()
 
-            await self.async_set_unique_id(device)
-            self._abort_if_unique_id_configured()
+        return self.async_show_form(
+            step_id="reauth_confirm",
+            data_schema=vol.Schema({vol.Required(CONF_PASSWORD): str}),
+            description_placeholders={"email": email},
+            errors=errors,
+        )
 
-            device_data = next(
-                (e for e in self.data[CONF_DEVICES] if str(e["id"]) == device),
-                None,
-            )
-            data = {
-                CONF_DEVICE_ID: device,
-                MAIN_SENSOR: main_sensor,
-                CONF_EMAIL: self.data[CONF_EMAIL],
-                CONF_PASSWORD: self.data[CONF_PASSWORD],
-            }
-            return self.async_create_entry(
-                title=device_data["displayName"],
-                data=data,
-            )
+    async def async_step_pick_device(self, user_input=None):
+        """Get device selection from the user.
 
+        Any number of the devices found on the account can be added to a
+        single entry, sharing one poll of the account.
+        """
+        errors = {}
+        configured = async_configured_device_ids(self.hass)
         devices = {
-            str(device["id"]): device["displayName"]
+            str(device.id): device.display_name
             for device in self.data[CONF_DEVICES]
+            if str(device.id) not in configured
         }
+        if not devices:
+            return self.async_abort(reason="already_configured")
+
+        if user_input is not None:
+            selected = [
+                device_id
+                for device_id in devices
+                if device_id in user_input[CONF_DEVICES]
+            ]
+            if selected:
+                # Entries are identified by their first device, like single
+                # device entries always were
+                await self.async_set_unique_id(selected[0])
+                self._abort_if_unique_id_configured()
+
+                data = {
+                    CONF_DEVICES: selected,
+                    CONF_EXCLUDED_DEVICES: [
+                        device_id for device_id in devices if device_id not in selected
+                    ],
+                    CONF_ADD_NEW_DEVICES: user_input[CONF_ADD_NEW_DEVICES],
+                    MAIN_SENSOR: user_input[MAIN_SENSOR],
+                    CONF_EMAIL: self.data[CONF_EMAIL],
+                    CONF_PASSWORD: self.data[CONF_PASSWORD],
+                }
+                # The polling options are those of the account
+                account_entries = async_account_entries(
+                    self.hass, self.data[CONF_EMAIL]
+                )
+                return self.async_create_entry(
+                    title=(
+                        devices[selected[0]]
+                        if len(selected) == 1
+                        else self.data[CONF_EMAIL]
+                    ),
+                    data=data,
+                    options=(
+                        dict(account_entries[0].options) if account_entries else None
+                    ),
+                )
+            errors[CONF_DEVICES] = "no_devices"
+
         schema = vol.Schema(
             {
-                vol.Required(CONF_DEVICE_ID): vol.In(devices),
+                vol.Required(CONF_DEVICES, default=list(devices)): cv.multi_select(
+                    devices
+                ),
                 vol.Optional(MAIN_SENSOR, default="floor"): vol.In(["floor", "room"]),
+                vol.Optional(CONF_ADD_NEW_DEVICES, default=True): bool,
             }
         )
 
         return self.async_show_form(
             step_id="pick_device", data_schema=schema, errors=errors
         )
+
+
+class EbecoOptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle Ebeco options."""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        """Initialize options flow."""
+        self._entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        """Manage the polling options of the account."""
+        if user_input is not None:
+            # Every entry of the account shares its polling, and so its options
+            email = self._entry.data[CONF_EMAIL]
+            for entry in async_account_entries(self.hass, email):
+                if entry.entry_id != self._entry.entry_id:
+                    self.hass.config_entries.async_update_entry(
+                        entry, options={**entry.options, **user_input}
+                    )
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self._entry.options
+        schema = vol.Schema(
+            {
+                vol.Optional(
+                    CONF_MAX_REFRESH_INTERVAL,
+                    default=options.get(
+                        CONF_MAX_REFRESH_INTERVAL, DEFAULT_MAX_REFRESH_INTERVAL_MINUTES
+                    ),
+                ): vol.All(vol.Coerce(int), vol.Range(min=REFRESH_INTERVAL_MINUTES)),
+                vol.Optional(
+                    CONF_REQUEST_DEADLINE,
+                    default=options.get(
+                        CONF_REQUEST_DEADLINE, DEFAULT_REQUEST_DEADLINE_SECONDS
+                    ),
+                ): vol.All(
+                    vol.Coerce(int),
+                    vol.Range(
+                        min=MIN_REQUEST_DEADLINE_SECONDS,
+                        max=MAX_REQUEST_DEADLINE_SECONDS,
+                    ),
+                ),
+                vol.Optional(
+                    CONF_STALE_WINDOW,
+                    default=options.get(
+                        CONF_STALE_WINDOW, DEFAULT_STALE_WINDOW_MINUTES
+                    ),
+                ): vol.All(
+                    vol.Coerce(int), vol.Range(min=0, max=MAX_STALE_WINDOW_MINUTES)
+                ),
+            }
+        )
+
+        return self.async_show_form(step_id="init", data_schema=schema)
@@ -3,8 +3,48 @@
 from enum import StrEnum
 
 DOMAIN = "ebeco"
+DATA_ACCOUNTS = "accounts"
 MAIN_SENSOR = "main_sensor"
+# Devices an entry was set up without, and if devices added to the account
+# later are added to the entry
+CONF_EXCLUDED_DEVICES = "excluded_devices"
+CONF_ADD_NEW_DEVICES = "add_new_devices"
+# Dispatched with the ids of devices added to an entry
+SIGNAL_NEW_DEVICES = f"{DOMAIN}_new_devices_{{}}"
 REFRESH_INTERVAL_MINUTES = 1
+CONF_MAX_REFRESH_INTERVAL = "max_refresh_interval"
+DEFAULT_MAX_REFRESH_INTERVAL_MINUTES = 10
+# Time allowed for a whole API call, including login, retries and backoff
+CONF_REQUEST_DEADLINE = "request_deadline"
+DEFAULT_REQUEST_DEADLINE_SECONDS = 30
+MIN_REQUEST_DEADLINE_SECONDS = 5
+MAX_REQUEST_DEADLINE_SECONDS = 300
+# Keep showing the last fetched data this long while refreshes fail, before
+# the entities become unavailable
+CONF_STALE_WINDOW = "stale_window"
+DEFAULT_STALE_WINDOW_MINUTES = 30
+MAX_STALE_WINDOW_MINUTES = 24 * 60
+# Poll faster for a while after a relay switched
+FAST_REFRESH_INTERVAL_SECONDS = 15
+FAST_REFRESH_WINDOW_SECONDS = 120
+# Refresh once this long after a write to check that the device applied it
+VERIFY_DELAY_SECONDS = 10
+# Show written values until the API reports them, but at most this long
+PENDING_CHANGE_TIMEOUT_SECONDS = 120
+# Start backing off after this many polls in a row returned the same data
+UNCHANGED_REFRESHES_BEFORE_BACKOFF = 3
+TOKEN_STORAGE_VERSION = 1
+# Last fetched data of the devices of an account, used until the first refresh
+# after a restart is done
+SNAPSHOT_STORAGE_VERSION = 1
+SNAPSHOT_SAVE_DELAY_SECONDS = 30
+# Changes to a device made within this window are sent in a single request
+WRITE_DEBOUNCE_SECONDS = 0.5
+SERVICE_BULK_SET = "bulk_set"
+ATTR_POWER = "power"
+# Writes of a bulk_set call in flight at once, at most the request burst of
+# the account
+ATTR_MAX_CONCURRENCY = "max_concurrency"
 PRESET_MANUAL = "Manual"  # Enable Manual mode on the thermostat
 PRESET_WEEK = "Home"  # Enable The Week program on the thermostat, defined in the phone app or thermostat menu. Misleading value "home" in api instead of "week"
 PRESET_TIMER = "Timer"  # Enable the timer on the thermostat, defined in the phone app or thermostat menu
@@ -0,0 +1,401 @@
+"""Account wide data update coordinator for Ebeco thermostats."""
+
+from datetime import timedelta
+import logging
+import time
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryAuthFailed
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .const import (
+    DEFAULT_MAX_REFRESH_INTERVAL_MINUTES,
+    DEFAULT_STALE_WINDOW_MINUTES,
+    FAST_REFRESH_INTERVAL_SECONDS,
+    FAST_REFRESH_WINDOW_SECONDS,
+    REFRESH_INTERVAL_MINUTES,
+    SNAPSHOT_SAVE_DELAY_SECONDS,
+    UNCHANGED_REFRESHES_BEFORE_BACKOFF,
+    VERIFY_DELAY_SECONDS,
+)
+from .data_handler import EbecoApi, EbecoAuthError, EbecoDeviceState, RequestPriority
+from .ebeco_device import EbecoDevice
+from .history import EbecoDeviceHistory
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EbecoCoordinator(DataUpdateCoordinator):
+    """Fetch all devices on an Ebeco account with a single request.
+
+    The coordinator data is a dict of device snapshots keyed by the device id as
+    a string, which is shared by the entities of every thermostat on the account.
+
+    The last fetched data is saved in ``snapshot_store`` with the time it was
+    fetched, so entities can be set up from it right away after a restart,
+    flagged as stale until the first refresh is done. Saved data older than
+    ``stale_window`` is not used.
+
+    Written values are shown until a refresh confirms them. A single
+    verification refresh is scheduled a little while after a write, covering
+    every write made in the meantime.
+
+    When refreshes fail, the last fetched data keeps being shown, flagged as
+    stale, for up to ``stale_window``. It is refreshed in the background in
+    the meantime, backing off between attempts.
+
+    Every poll adds a sample to the rolling ``history`` of each device.
+
+    The refresh interval adapts to the account: it is shortened for a while
+    after a relay switches, grows towards
+    ``max_interval`` while polls keep returning the same data, and grows when
+    the API starts rate limiting requests.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        api: EbecoApi,
+        max_interval: timedelta = timedelta(
+            minutes=DEFAULT_MAX_REFRESH_INTERVAL_MINUTES
+        ),
+        snapshot_store: Store | None = None,
+        stale_window: timedelta = timedelta(minutes=DEFAULT_STALE_WINDOW_MINUTES),
+    ) -> None:
+        """Initialize the coordinator."""
+        self.base_interval = timedelta(minutes=REFRESH_INTERVAL_MINUTES)
+        super().__init__(
+            hass,
+            _LOGGER,
+            name="Ebeco",
+            update_interval=self.base_interval,
+            # Listeners are only called when a poll returns different data
+            always_update=False,
+        )
+        self.api = api
+        self.devices: dict[str, EbecoDevice] = {}
+        self.history: dict[str, EbecoDeviceHistory] = {}
+        self._history_listeners: list[CALLBACK_TYPE] = []
+        self.max_interval = max(max_interval, self.base_interval)
+        self._fast_until = 0.0
+        self._unchanged_refreshes = 0
+        self._rate_limited_count = api.rate_limited_count
+        self._rate_limit_interval = timedelta(0)
+        self._verify_handle = None
+        # Lane of the next fetch, verifications confirm writes
+        self._refresh_priority = RequestPriority.POLL
+        self._snapshot_store = snapshot_store
+        self.stale = False
+        self.stale_window = stale_window
+        # When the data was last fetched, as time.monotonic()
+        self._refreshed_at: float | None = None
+        # When the saved data was fetched, as time.time()
+        self._saved_fetched_at = 0.0
+        self._failed_refreshes = 0
+        self._expire_handle = None
+
+    def get_device(self, device_id) -> EbecoDevice:
+        """Return the device wrapper for a device id, creating it if needed."""
+        key = str(device_id)
+        device = self.devices.get(key)
+        if device is None:
+            device = self.devices[key] = EbecoDevice(device_id, self.api)
+            if self.data is not None and key in self.data:
+                device.set_device(self.data[key])
+        return device
+
+    async def _async_update_data(self):
+        """Fetch every device on the account."""
+        _LOGGER.debug("Attempting to fetch new data from Ebeco API")
+        versions = {key: device.begin_fetch() for key, device in self.devices.items()}
+        priority, self._refresh_priority = self._refresh_priority, RequestPriority.POLL
+        try:
+            devices = await self.api.fetch_user_devices(priority)
+        except EbecoAuthError as err:
+            # Polling stops until the password is entered again
+            self._async_refresh_failed()
+            raise ConfigEntryAuthFailed(err) from err
+        except Exception as err:
+            self._async_refresh_failed()
+            raise UpdateFailed(err) from err
+
+        if devices is None:
+            self._async_refresh_failed()
+            raise UpdateFailed("No device data received from Ebeco API")
+
+        _LOGGER.debug("Received data: %s", devices)
+        previous = self.data or {}
+        data = {}
+        for state in devices:
+            key = str(state.id)
+            device = self.devices.get(key)
+            if device is not None:
+                state = device.reconcile(state, versions.get(key))
+            # Keep the previous snapshot of unchanged devices, so an identical
+            # poll returns data that compares equal without a deep comparison
+            # and unchanged entities can skip writing state
+            old = previous.get(key)
+            data[key] = old if old == state else state
+        for key, device in self.devices.items():
+            if key in data:
+                device.set_device(data[key])
+        self._refreshed_at = time.monotonic()
+        self._failed_refreshes = 0
+        if self._expire_handle is not None:
+            self._expire_handle.cancel()
+            self._expire_handle = None
+        self._async_record_history(data)
+        self._async_adjust_interval(data)
+        if self.stale:
+            self.stale = False
+            # Listeners are only called for changed data, but they also have
+            # to know the data is current now
+            self.hass.loop.call_soon(self.async_update_listeners)
+        if (
+            data != previous
+            # Keep the age of saved data the same polls confirm from growing
+            # towards the stale window
+            or time.time() - self._saved_fetched_at
+            > self.stale_window.total_seconds() / 2
+        ):
+            self._async_save_snapshot(data)
+        if any(device.has_pending_changes for device in self.devices.values()):
+            self._async_schedule_verification()
+        elif self._verify_handle is not None:
+            # This refresh already confirmed every write
+            self._verify_handle.cancel()
+            self._verify_handle = None
+        return data
+
+    @property
+    def data_available(self) -> bool:
+        """Return if the data may be shown, fresh or within the stale window."""
+        if self.last_update_success:
+            return True
+        return (
+            self.data is not None
+            and self._refreshed_at is not None
+            and time.monotonic() - self._refreshed_at
+            < self.stale_window.total_seconds()
+        )
+
+    @property
+    def data_age(self) -> int | None:
+        """Return the number of seconds since the data was fetched."""
+        if self._refreshed_at is None:
+            return None
+        return round(time.monotonic() - self._refreshed_at)
+
+    @callback
+    def _async_refresh_failed(self) -> None:
+        """Keep serving the data, and try again after a backoff."""
+        self._failed_refreshes += 1
+        self._async_adjust_interval(None)
+        if self.data is None or self._refreshed_at is None:
+            return
+        self.stale = True
+        # Listeners are only called for the first of several failures in a
+        # row, but the age of the data changed
+        self.hass.loop.call_soon(self.async_update_listeners)
+        if self._expire_handle is None:
+            remaining = self.stale_window.total_seconds() - (
+                time.monotonic() - self._refreshed_at
+            )
+            self._expire_handle = self.hass.loop.call_later(
+                max(remaining, 0), self._async_stale_expired
+            )
+
+    @callback
+    def _async_stale_expired(self) -> None:
+        _LOGGER.warning(
+            "Ebeco data could not be refreshed for %s, marking it unavailable",
+            self.stale_window,
+        )
+        self._expire_handle = None
+        self.async_update_listeners()
+
+    @callback
+    def _async_record_history(self, data) -> None:
+        now = time.monotonic()
+        if self.history.keys() - data.keys():
+            # Forget devices removed from the account
+            self.history = {
+                key: history for key, history in self.history.items() if key in data
+            }
+        for key, state in data.items():
+            history = self.history.get(key)
+            if history is None:
+                history = self.history[key] = EbecoDeviceHistory()
+            history.add(
+                now, state.relay_on, state.temperature_floor, state.temperature_room
+            )
+        if self._history_listeners:
+            # Once the data of the poll is set
+            self.hass.loop.call_soon(self._async_history_updated)
+
+    @callback
+    def async_add_history_listener(
+        self, update_callback: CALLBACK_TYPE
+    ) -> CALLBACK_TYPE:
+        """Listen for the samples every poll adds, even if the data is the same.
+
+        Return a function that removes the listener again.
+        """
+        self._history_listeners.append(update_callback)
+
+        @callback
+        def remove_listener() -> None:
+            self._history_listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def _async_history_updated(self) -> None:
+        for update_callback in list(self._history_listeners):
+            update_callback()
+
+    async def async_load_snapshot(self) -> bool:
+        """Use the saved data until the first refresh, and start that refresh.
+
+        Return False, without starting a refresh, if there is no saved data or
+        it is older than the stale window.
+        """
+        if self._snapshot_store is None:
+            return False
+        try:
+            stored = await self._snapshot_store.async_load()
+            if not stored or "fetched_at" not in stored:
+                # Nothing saved, or saved without the time it was fetched
+                return False
+            fetched_at = stored["fetched_at"]
+            data = {
+                key: EbecoDeviceState.from_dict(state)
+                for key, state in stored["devices"].items()
+            }
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to load saved Ebeco device data", exc_info=True)
+            return False
+        age = max(time.time() - fetched_at, 0)
+        if not data or age >= self.stale_window.total_seconds():
+            _LOGGER.debug("Not using saved data fetched %s seconds ago", round(age))
+            return False
+
+        _LOGGER.debug("Using saved data of %s devices until refreshed", len(data))
+        self.data = data
+        self.stale = True
+        self._refreshed_at = time.monotonic() - age
+        self._saved_fetched_at = fetched_at
+        self.hass.async_create_background_task(
+            self.async_refresh(), "ebeco first refresh"
+        )
+        return True
+
+    @callback
+    def _async_save_snapshot(self, data) -> None:
+        if self._snapshot_store is None:
+            return
+        fetched_at = self._saved_fetched_at = time.time()
+        self._snapshot_store.async_delay_save(
+            lambda: {
+                "fetched_at": fetched_at,
+                "devices": {key: state.as_dict() for key, state in data.items()},
+            },
+            SNAPSHOT_SAVE_DELAY_SECONDS,
+        )
+
+    @callback
+    def async_note_write(self) -> None:
+        """Check that a write was applied, and stop backing off for now."""
+        self._unchanged_refreshes = 0
+        self.update_interval = self._async_interval()
+        self._async_schedule_verification()
+
+    @callback
+    def _async_schedule_verification(self) -> None:
+        if self._verify_handle is not None:
+            # Already covered by the pending verification
+            return
+        self._verify_handle = self.hass.loop.call_later(
+            VERIFY_DELAY_SECONDS, self._async_verify
+        )
+
+    @callback
+    def _async_verify(self) -> None:
+        self._verify_handle = None
+        self._refresh_priority = RequestPriority.CONFIRM
+        self.hass.async_create_background_task(
+            self.async_refresh(), "ebeco verify written values"
+        )
+
+    async def async_shutdown(self) -> None:
+        """Cancel pending timers and stop polling."""
+        if self._verify_handle is not None:
+            self._verify_handle.cancel()
+            self._verify_handle = None
+        if self._expire_handle is not None:
+            self._expire_handle.cancel()
+            self._expire_handle = None
+        await super().async_shutdown()
+
+    @callback
+    def async_set_device_data(self, device_id, state: EbecoDeviceState) -> None:
+        """Push locally updated data for a single device to all listeners."""
+        self.async_set_devices_data({device_id: state})
+
+    @callback
+    def async_set_devices_data(self, states: dict) -> None:
+        """Push locally updated data for several devices in a single update."""
+        self.async_set_updated_data(
+            {**self.data, **{str(key): state for key, state in states.items()}}
+        )
+
+    @callback
+    def _async_adjust_interval(self, data) -> None:
+        """Pick the interval until the next poll from the result of this one."""
+        if self.api.rate_limited_count != self._rate_limited_count:
+            self._rate_limited_count = self.api.rate_limited_count
+            self._rate_limit_interval = min(
+                max(self._rate_limit_interval * 2, self.base_interval * 2),
+                self.max_interval,
+            )
+            _LOGGER.debug(
+                "Rate limited by Ebeco API, polling at most every %s",
+                self._rate_limit_interval,
+            )
+        elif self._rate_limit_interval:
+            self._rate_limit_interval /= 2
+            if self._rate_limit_interval <= self.base_interval:
+                self._rate_limit_interval = timedelta(0)
+
+        if data is not None and self.data is not None:
+            if data == self.data:
+                self._unchanged_refreshes += 1
+            else:
+                self._unchanged_refreshes = 0
+                if any(
+                    key in self.data and state.relay_on != self.data[key].relay_on
+                    for key, state in data.items()
+                ):
+                    self._fast_until = time.monotonic() + FAST_REFRESH_WINDOW_SECONDS
+
+        self.update_interval = self._async_interval()
+
+    @callback
+    def _async_interval(self) -> timedelta:
+        if self._failed_refreshes:
+            interval = min(
+                timedelta(seconds=FAST_REFRESH_INTERVAL_SECONDS)
+                * 2 ** min(self._failed_refreshes - 1, 16),
+                self.max_interval,
+            )
+        elif time.monotonic() < self._fast_until:
+            interval = timedelta(seconds=FAST_REFRESH_INTERVAL_SECONDS)
+        elif self._unchanged_refreshes >= UNCHANGED_REFRESHES_BEFORE_BACKOFF:
+            backoff = self._unchanged_refreshes - UNCHANGED_REFRESHES_BEFORE_BACKOFF
+            interval = min(
+                self.base_interval * 2 ** min(backoff + 1, 16), self.max_interval
+            )
+        else:
+            interval = self.base_interval
+        return max(interval, self._rate_limit_interval)
@@ -1,172 +1,1113 @@
 """Communicate with the Ebeco API."""
 
 import asyncio
-from collections import namedtuple
+import base64
+import bisect
+from collections import deque
+from dataclasses import asdict, dataclass, replace
 import datetime
-from enum import Enum
+from email.utils import parsedate_to_datetime
+from enum import Enum, IntEnum
+import heapq
 from http import HTTPStatus
+import itertools
 import json
 import logging
+import random
+import time
 
 import aiohttp
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:  # pragma: no cover
+    _json_loads = json.loads
+
+try:
+    from .const import DEFAULT_REQUEST_DEADLINE_SECONDS
+except ImportError:
+    # Imported on its own by the scripts, outside the package
+    from const import DEFAULT_REQUEST_DEADLINE_SECONDS
+
 API_URL = "https://ebecoconnect.com/api"
+# Refresh the bearer token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 300
+# Consider a token expired slightly early to allow for clock skew
+TOKEN_EXPIRY_SKEW = 30
+# Request budget shared by everything talking to the API for one account
+RATE_LIMIT_PER_SECOND = 2
+RATE_LIMIT_BURST = 10
+# Tokens in the bucket that background requests leave for user requests
+RATE_LIMIT_USER_RESERVE = 2
+# Connection pool of the dedicated websession
+CONNECTOR_LIMIT = 8
+CONNECTOR_KEEPALIVE_SECONDS = 60
+CONNECTOR_DNS_CACHE_SECONDS = 300
+# Retries of a failed request, with exponential backoff and jitter
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 8
+# Consecutive failures after which requests fail fast for a while
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_SECONDS = 60
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Number of recent requests latency percentiles are computed from
+LATENCY_SAMPLES = 200
 _LOGGER = logging.getLogger(__name__)
 
 
+# API fields that can be changed, and the snapshot attribute holding them
+WRITABLE_FIELDS = {
+    "powerOn": "power_on",
+    "selectedProgram": "selected_program",
+    "temperatureSet": "temperature_set",
+}
+
+
 class RequestType(Enum):
     GET = 1
     PUT = 2
     POST = 3
 
 
+class RequestPriority(IntEnum):
+    """Lane of a request, lanes are served in this order when the budget is tight.
+
+    WRITE is for changes made by the user, CONFIRM for reads checking that a
+    change was applied, POLL for regular polls and DISCOVERY for looking up
+    the devices of an account.
+    """
+
+    WRITE = 0
+    CONFIRM = 1
+    POLL = 2
+    DISCOVERY = 3
+
+
+@dataclass(frozen=True, slots=True)
+class EbecoDeviceState:
+    """Snapshot of the parts of a device used by the integration.
+
+    Built once per poll so reading it is cheap, everything else in the API
+    response is dropped right after decoding.
+    """
+
+    id: int
+    display_name: str
+    building: str | None
+    power_on: bool
+    relay_on: bool
+    selected_program: str | None
+    temperature_set: float | None
+    temperature_floor: float | None
+    temperature_room: float | None
+    todays_on_minutes: int
+    installed_effect: int
+
+    @classmethod
+    def from_api(cls, data):
+        """Create a snapshot from device data returned by the API."""
+        get = data.get
+        building = get("building")
+        floor = get("temperatureFloorDecimals")
+        room = get("temperatureRoomDecimals")
+        return cls(
+            data["id"],
+            data["displayName"],
+            building.get("name") if building else None,
+            get("powerOn") is True,
+            get("relayOn") is True,
+            get("selectedProgram"),
+            get("temperatureSet"),
+            # Prefer the decimal temperatures that newer thermostats report
+            get("temperatureFloor") if floor is None else floor,
+            get("temperatureRoom") if room is None else room,
+            get("todaysOnMinutes") or 0,
+            get("installedEffect") or 0,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a snapshot from a dict made by as_dict."""
+        return cls(**data)
+
+    def as_dict(self):
+        """Return the snapshot as a JSON serializable dict."""
+        return asdict(self)
+
+    def with_changes(self, changes):
+        """Return a copy with changes, keyed by API field name, applied."""
+        return replace(
+            self, **{WRITABLE_FIELDS[field]: value for field, value in changes.items()}
+        )
+
+
+class EbecoEndpointMetrics:
+    """Request counters and latency histogram of a single API endpoint."""
+
+    __slots__ = ("requests", "errors", "latency_sum", "latency_buckets")
+
+    def __init__(self) -> None:
+        """Init the counters."""
+        self.requests = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        # One bucket per bound in LATENCY_BUCKETS and one for slower requests
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def as_dict(self):
+        """Return the counters as a dict."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_sum": round(self.latency_sum, 3),
+            "latency_buckets": dict(
+                zip(
+                    [*(str(bound) for bound in LATENCY_BUCKETS), "+Inf"],
+                    self.latency_buckets,
+                )
+            ),
+        }
+
+
+class EbecoApiMetrics:
+    """Counters describing how the API has behaved for an account."""
+
+    def __init__(self) -> None:
+        """Init the counters."""
+        self.endpoints: dict[str, EbecoEndpointMetrics] = {}
+        self.retries = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.token_refreshes = 0
+        self.bytes_received = 0
+        # Reads answered by an identical read that was waiting to be sent
+        self.shared_reads = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    @property
+    def requests(self) -> int:
+        """Return the number of requests sent to any endpoint."""
+        return sum(metrics.requests for metrics in self.endpoints.values())
+
+    @property
+    def errors(self) -> int:
+        """Return the number of requests that failed."""
+        return sum(metrics.errors for metrics in self.endpoints.values())
+
+    def record_response(self, endpoint, seconds, status, size=0) -> None:
+        """Record a request that got a response."""
+        metrics = self._endpoint(endpoint)
+        metrics.latency_sum += seconds
+        metrics.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if status != HTTPStatus.OK:
+            metrics.errors += 1
+        if status == HTTPStatus.TOO_MANY_REQUESTS:
+            self.rate_limited += 1
+        self.bytes_received += size
+        self._latencies.append(seconds)
+
+    def record_failure(self, endpoint, timeout=False) -> None:
+        """Record a request that got no response."""
+        self._endpoint(endpoint).errors += 1
+        if timeout:
+            self.timeouts += 1
+
+    def latency_percentile(self, percentile):
+        """Return a percentile of the recent latencies in seconds, if any."""
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        index = round(percentile / 100 * (len(latencies) - 1))
+        return latencies[index]
+
+    def as_dict(self):
+        """Return all counters as a dict."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "rate_limited": self.rate_limited,
+            "token_refreshes": self.token_refreshes,
+            "bytes_received": self.bytes_received,
+            "shared_reads": self.shared_reads,
+            "endpoints": {
+                endpoint: metrics.as_dict()
+                for endpoint, metrics in self.endpoints.items()
+            },
+        }
+
+    def _endpoint(self, endpoint) -> EbecoEndpointMetrics:
+        metrics = self.endpoints.get(endpoint)
+        if metrics is None:
+            metrics = self.endpoints[endpoint] = EbecoEndpointMetrics()
+        metrics.requests += 1
+        return metrics
+
+
+class EbecoApiError(Exception):
+    """Error talking to the Ebeco API."""
+
+
+class EbecoAuthError(EbecoApiError):
+    """The Ebeco API rejected the username or password."""
+
+
+class EbecoCircuitOpenError(EbecoApiError):
+    """The Ebeco API is considered down, so the request was not sent."""
+
+
+class EbecoDeadlineExceeded(EbecoApiError):
+    """An API call did not finish within its deadline."""
+
+
+class EbecoCircuitBreaker:
+    """Fail fast while the API of an account keeps failing.
+
+    After ``failure_threshold`` calls in a row failed, retries included, the
+    circuit opens and every request fails straight away. Once
+    ``reset_timeout`` seconds have passed a single call is let through as a
+    probe, and its outcome decides whether the circuit closes again or stays
+    open for another ``reset_timeout``.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_SECONDS,
+    ) -> None:
+        """Init the circuit breaker."""
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        """Return if requests are currently failing fast."""
+        return self._opened_at is not None
+
+    def before_request(self) -> None:
+        """Raise EbecoCircuitOpenError if a request may not be sent now."""
+        if self._opened_at is None:
+            return
+        if self._probing or time.monotonic() - self._opened_at < self._reset_timeout:
+            raise EbecoCircuitOpenError("Ebeco API is unavailable")
+        _LOGGER.debug("Probing if the Ebeco API is available again")
+        self._probing = True
+
+    def record_success(self) -> None:
+        """Close the circuit after a request got a proper answer."""
+        if self._opened_at is not None:
+            _LOGGER.info("Ebeco API is available again")
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Count a failed request, opening the circuit if there are too many."""
+        self._failures += 1
+        if self._probing or (
+            self._opened_at is None and self._failures >= self._failure_threshold
+        ):
+            if self._opened_at is None:
+                _LOGGER.warning(
+                    "Ebeco API failed %s times in a row, pausing requests for %s"
+                    " seconds",
+                    self._failures,
+                    self._reset_timeout,
+                )
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """Give up a request without an outcome, e.g. when it was cancelled."""
+        self._probing = False
+
+
+def _backoff_delay(attempt):
+    """Return the time to wait before a retry, with full jitter."""
+    return random.uniform(0, min(RETRY_BACKOFF_BASE * 2**attempt, RETRY_BACKOFF_MAX))
+
+
+def _is_outage(err):
+    """Return if an error means the API is unreachable or failing."""
+    if isinstance(err, aiohttp.ClientResponseError):
+        return err.status >= HTTPStatus.INTERNAL_SERVER_ERROR
+    return True
+
+
+def _endpoint_name(url):
+    """Return the name of the API endpoint a URL points to."""
+    return url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+
+
+def _retry_after(response):
+    """Return the number of seconds a response asks us to wait, if any."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+def _jwt_expiry(token):
+    """Return the expiry of a JWT as a unix timestamp, or None if unknown."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(_json_loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class EbecoTokenManager:
+    """Keep the bearer token of an account valid.
+
+    The token is persisted in ``store`` (any object with ``async_load`` and
+    ``async_save``, such as a Home Assistant ``Store``) so it survives restarts,
+    and is refreshed in the background shortly before it expires.
+    """
+
+    def __init__(self, login, store=None, refresh_margin=TOKEN_REFRESH_MARGIN):
+        """Init the token manager with a coroutine function that logs in."""
+        self._login = login
+        self._store = store
+        self._refresh_margin = refresh_margin
+        self._load_task = None
+        self._login_task = None
+        self._refresh_handle = None
+        self._refresh_task = None
+        self.access_token = None
+        self.expires_at = None
+
+    @property
+    def valid(self) -> bool:
+        """Return if there is a token that has not expired."""
+        if self.access_token is None:
+            return False
+        if self.expires_at is None:
+            return True
+        return time.time() < self.expires_at - TOKEN_EXPIRY_SKEW
+
+    async def async_get_token(self):
+        """Return a valid token, logging in if needed."""
+        if self._store is not None:
+            if self._load_task is None:
+                self._load_task = asyncio.ensure_future(self._async_load())
+            await asyncio.shield(self._load_task)
+        if not self.valid:
+            await self.async_refresh()
+        return self.access_token
+
+    async def async_refresh(self):
+        """Log in and store the new token.
+
+        Only one login is in flight at a time, concurrent callers wait for it
+        and share its result or failure.
+        """
+        if self._login_task is None:
+            self._login_task = asyncio.ensure_future(self._async_login())
+            self._login_task.add_done_callback(self._login_done)
+        await asyncio.shield(self._login_task)
+
+    async def async_invalidate(self, access_token):
+        """Drop a token that the API rejected."""
+        if access_token is None or access_token != self.access_token:
+            # Already replaced by a newer token
+            return
+        _LOGGER.debug("Dropping rejected access token")
+        self._set_token(None, None)
+        await self._async_save()
+
+    def close(self) -> None:
+        """Stop refreshing the token in the background."""
+        self._cancel_refresh()
+        for task in (self._refresh_task, self._login_task):
+            if task is not None:
+                task.cancel()
+        self._refresh_task = None
+
+    async def _async_login(self):
+        access_token, expires_at = await self._login()
+        self._set_token(access_token, expires_at)
+        await self._async_save()
+
+    def _login_done(self, task) -> None:
+        self._login_task = None
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
+
+    async def _async_load(self):
+        try:
+            data = await self._store.async_load()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to load stored Ebeco access token", exc_info=True)
+            return
+        if not data or self.access_token is not None:
+            return
+        self._set_token(data.get("access_token"), data.get("expires_at"))
+        if self.valid:
+            _LOGGER.debug("Using stored access token")
+
+    async def _async_save(self):
+        if self._store is None:
+            return
+        await self._store.async_save(
+            {"access_token": self.access_token, "expires_at": self.expires_at}
+        )
+
+    def _set_token(self, access_token, expires_at) -> None:
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self._cancel_refresh()
+        if access_token is None or expires_at is None:
+            return
+        remaining = expires_at - time.time()
+        # Short lived tokens are refreshed halfway through their lifetime
+        delay = max(remaining - self._refresh_margin, remaining / 2, 0)
+        self._refresh_handle = asyncio.get_running_loop().call_later(
+            delay, self._start_background_refresh
+        )
+
+    def _cancel_refresh(self) -> None:
+        if self._refresh_handle is not None:
+            self._refresh_handle.cancel()
+            self._refresh_handle = None
+
+    def _start_background_refresh(self) -> None:
+        self._refresh_handle = None
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._async_background_refresh())
+
+    async def _async_background_refresh(self):
+        _LOGGER.debug("Refreshing access token before it expires")
+        try:
+            await self.async_refresh()
+        except Exception:  # pylint: disable=broad-except
+            # The current token is still usable, the next request after it
+            # expires will log in again
+            _LOGGER.warning("Unable to refresh Ebeco access token", exc_info=True)
+
+
+class EbecoRateLimiter:
+    """Token bucket shared by every request made for an account.
+
+    Waiting requests are served in priority order, and polls and discovery
+    leave a few tokens in the bucket so writes and their confirmation can
+    still go through straight away when the budget is tight.
+    """
+
+    def __init__(
+        self,
+        rate=RATE_LIMIT_PER_SECOND,
+        burst=RATE_LIMIT_BURST,
+        user_reserve=RATE_LIMIT_USER_RESERVE,
+    ):
+        """Init the limiter."""
+        self._rate = rate
+        self._burst = burst
+        self._user_reserve = min(user_reserve, burst - 1)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+
+    async def async_acquire(self, priority=RequestPriority.POLL):
+        """Wait until the request may be sent."""
+        if (not self._waiters or priority < self._waiters[0][0]) and self._try_take(
+            priority
+        ):
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        if self._waiters[0][2] is waiter and self._wakeup is not None:
+            # The wakeup was timed for a request that now has to wait longer
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._schedule_wakeup()
+        await waiter
+
+    @property
+    def burst(self) -> int:
+        """Return the number of requests that may be sent at once."""
+        return self._burst
+
+    def block_for(self, seconds) -> None:
+        """Hold back every request for a while, e.g. as asked by Retry-After."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = self._blocked_until
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        if self._waiters:
+            self._schedule_wakeup()
+
+    def _try_take(self, priority) -> bool:
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return False
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+        needed = self._needed(priority)
+        if self._tokens < needed:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _needed(self, priority) -> int:
+        """Return the tokens that have to be left to send a request."""
+        if priority <= RequestPriority.CONFIRM:
+            return 1
+        return 1 + self._user_reserve
+
+    def _schedule_wakeup(self) -> None:
+        if self._wakeup is not None:
+            return
+        needed = self._needed(self._waiters[0][0])
+        now = time.monotonic()
+        delay = max(
+            self._blocked_until - now,
+            (needed - self._tokens) / self._rate - (now - self._updated),
+            0,
+        )
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self) -> None:
+        self._wakeup = None
+        while self._waiters:
+            priority, _, waiter = self._waiters[0]
+            if waiter.done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if not self._try_take(priority):
+                break
+            heapq.heappop(self._waiters)
+            waiter.set_result(None)
+        if self._waiters:
+            self._schedule_wakeup()
+
+
+def create_websession(ssl_context=None, **kwargs) -> aiohttp.ClientSession:
+    """Create a client session with a connector tuned for the Ebeco API.
+
+    Every request goes to the same host, so a few kept alive connections and a
+    cached DNS lookup are all that is needed.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTOR_LIMIT,
+        limit_per_host=CONNECTOR_LIMIT,
+        ttl_dns_cache=CONNECTOR_DNS_CACHE_SECONDS,
+        keepalive_timeout=CONNECTOR_KEEPALIVE_SECONDS,
+        ssl=True if ssl_context is None else ssl_context,
+    )
+    return aiohttp.ClientSession(connector=connector, **kwargs)
+
+
+class _ReadAbandoned(EbecoApiError):
+    """A shared read was given up before its answer came, so it is sent again."""
+
+
+class _QueuedRead:
+    """A read waiting to be sent, whose answer later reads can share."""
+
+    __slots__ = ("priority", "waiters", "superseded", "outcome")
+
+    def __init__(self, priority, loop) -> None:
+        self.priority = priority
+        self.waiters = []
+        # Set to the read that took over, if a more urgent one came along
+        self.superseded = loop.create_future()
+        # The answer, or error, once the read is done
+        self.outcome = None
+
+    def set_result(self, result) -> None:
+        self.outcome = (result, None)
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    def set_exception(self, err) -> None:
+        self.outcome = (None, err)
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_exception(err)
+
+
 class EbecoApi:
     """Ebeco data handler."""
 
-    def __init__(self, username, password, websession) -> None:
-        """Init ebeco data handler."""
+    def __init__(
+        self,
+        username,
+        password,
+        websession=None,
+        token_store=None,
+        rate_limiter=None,
+        api_url=API_URL,
+        deadline=DEFAULT_REQUEST_DEADLINE_SECONDS,
+        recorder=None,
+    ) -> None:
+        """Init ebeco data handler.
+
+        If no websession is given, a dedicated one is created and closed again
+        by async_close. Every call fails with EbecoDeadlineExceeded if it takes
+        longer than deadline seconds in total. Responses are passed to recorder,
+        such as an EbecoCassetteRecorder, if one is given.
+        """
 
         self._username = username
         self._password = password
-        self.websession = websession
-        self._access_token = None
-        self._auth_header = None
+        self._api_url = api_url
+        self._owns_websession = websession is None
+        self.websession = websession or create_websession()
+        self.rate_limiter = rate_limiter or EbecoRateLimiter()
+        self.circuit_breaker = EbecoCircuitBreaker()
+        self._token_manager = EbecoTokenManager(self._getAccessToken, token_store)
         self._last_updated = datetime.datetime.utcnow() - datetime.timedelta(hours=2)
         self._timeout = 10
+        self.deadline = deadline
+        self.recorder = recorder
+        self.metrics = EbecoApiMetrics()
+        # Reads waiting for their turn, by URL
+        self._queued_reads: dict[str, _QueuedRead] = {}
 
-    async def fetch_user_devices(self):
+    async def fetch_user_devices(self, priority=RequestPriority.POLL):
         """Get user devices."""
 
-        response = await self._request(
-            API_URL + "/services/app/Devices/GetUserDevices/", RequestType.GET
+        json_data = await self._request(
+            self._api_url + "/services/app/Devices/GetUserDevices/",
+            RequestType.GET,
+            priority=priority,
         )
-
-        if response is None:
-            return
-
-        json_data = await response.json()
         if json_data is None:
             return
 
-        return json_data["result"]
+        return [EbecoDeviceState.from_api(device) for device in json_data["result"]]
 
-    async def fetch_user_device(self, device_id):
+    async def fetch_user_device(self, device_id, priority=RequestPriority.POLL):
         """Get a single device."""
 
-        response = await self._request(
-            API_URL + f"/services/app/Devices/GetUserDeviceById/?id={device_id}",
+        json_data = await self._request(
+            self._api_url + f"/services/app/Devices/GetUserDeviceById/?id={device_id}",
             RequestType.GET,
+            priority=priority,
         )
-
-        if response is None:
-            return
-
-        json_data = await response.json()
-        if json_data is None:
+        if json_data is None or json_data["result"] is None:
             return
 
-        return json_data["result"]
+        return EbecoDeviceState.from_api(json_data["result"])
 
-    async def set_room_target_temperature(self, json_data):
-        await self._request(
-            API_URL + "/services/app/Devices/UpdateUserDevice",
+    async def update_user_device(self, json_data):
+        """Update one or more settings of a device."""
+        response = await self._request(
+            self._api_url + "/services/app/Devices/UpdateUserDevice",
             RequestType.PUT,
             json_data=json_data,
+            priority=RequestPriority.WRITE,
         )
+        if response is None:
+            raise EbecoApiError(f"Unable to update device {json_data['id']}")
+
+    async def set_room_target_temperature(self, json_data):
+        await self.update_user_device(json_data)
 
     async def set_powerstate(self, json_data):
-        await self._request(
-            API_URL + "/services/app/Devices/UpdateUserDevice",
-            RequestType.PUT,
-            json_data=json_data,
-        )
+        await self.update_user_device(json_data)
 
     async def set_preset_mode(self, json_data):
-        await self._request(
-            API_URL + "/services/app/Devices/UpdateUserDevice",
-            RequestType.PUT,
-            json_data=json_data,
-        )
+        await self.update_user_device(json_data)
 
-    async def _getAccessToken(self, arg, max_retries: int = 6):
-        for attempt in range(max_retries):
-            response = await self.websession.post(
-                f"{API_URL}/TokenAuth",
-                headers={"Content-type": "application/json", "Abp.TenantId": "1"},
-                json={
-                    "userNameOrEmailAddress": self._username,
-                    "password": self._password,
-                },
-            )
+    @property
+    def rate_limited_count(self) -> int:
+        """Return the number of requests the API answered with 429."""
+        return self.metrics.rate_limited
+
+    @property
+    def password(self):
+        """Return the password used to log in."""
+        return self._password
+
+    @password.setter
+    def password(self, password):
+        """Log in with a new password from the next login on."""
+        self._password = password
+
+    def close(self) -> None:
+        """Release background resources held by the data handler."""
+        self._token_manager.close()
+
+    async def async_close(self):
+        """Release background resources and the websession if we created it."""
+        self.close()
+        if self._owns_websession:
+            await self.websession.close()
 
-            if response.status != HTTPStatus.TOO_MANY_REQUESTS:
+    async def _getAccessToken(self, max_retries: int = 6):
+        """Log in and return the access token and its expiry timestamp.
+
+        The login is shared by every request waiting for a token, so it gets a
+        deadline of its own rather than the one of the request that started it.
+        """
+        try:
+            async with asyncio.timeout(self.deadline) as timeout:
+                return await self._async_login(max_retries)
+        except TimeoutError as err:
+            if timeout.expired():
+                raise EbecoDeadlineExceeded(
+                    f"Login did not finish within {self.deadline} seconds"
+                ) from err
+            raise
+
+    async def _async_login(self, max_retries):
+        credentials = {
+            "userNameOrEmailAddress": self._username,
+            "password": self._password,
+        }
+        for attempt in range(max_retries):
+            # Every request waits for the login, so it is never held back
+            # behind background requests
+            await self.rate_limiter.async_acquire(RequestPriority.WRITE)
+            if attempt:
+                self.metrics.retries += 1
+            started = time.monotonic()
+            try:
+                async with asyncio.timeout(self._timeout):
+                    async with self.websession.post(
+                        f"{self._api_url}/TokenAuth",
+                        headers={
+                            "Content-type": "application/json",
+                            "Abp.TenantId": "1",
+                        },
+                        json=credentials,
+                    ) as response:
+                        status = response.status
+                        body = await response.read() if status == 200 else b""
+                        retry_after = _retry_after(response)
+            except asyncio.TimeoutError:
+                self.metrics.record_failure("TokenAuth", timeout=True)
+                self._record_error("POST", started, request=credentials, timeout=True)
+                raise
+            except aiohttp.ClientError:
+                self.metrics.record_failure("TokenAuth")
+                self._record_error("POST", started, request=credentials)
+                raise
+            elapsed = time.monotonic() - started
+            self.metrics.record_response("TokenAuth", elapsed, status, len(body))
+            if self.recorder is not None:
+                self.recorder.record(
+                    "POST",
+                    response.url,
+                    status,
+                    elapsed,
+                    body or None,
+                    retry_after,
+                    credentials,
+                )
+            if status in (
+                HTTPStatus.BAD_REQUEST,
+                HTTPStatus.UNAUTHORIZED,
+                HTTPStatus.FORBIDDEN,
+            ):
+                raise EbecoAuthError(f"Login rejected with status {status}")
+            if status != HTTPStatus.TOO_MANY_REQUESTS:
+                response.raise_for_status()
                 break
 
             _LOGGER.info("Backing off")
-            await asyncio.sleep(2**attempt)
+            self.rate_limiter.block_for(
+                2**attempt if retry_after is None else retry_after
+            )
+        else:
+            raise aiohttp.ClientResponseError(
+                response.request_info,
+                response.history,
+                status=response.status,
+                message="Too many login attempts",
+            )
 
-        response_string = await response.text()
-        token_data = json.loads(
-            response_string,
-            object_hook=lambda d: namedtuple("X", d.keys(), rename=True)(*d.values()),
-        )
+        token_data = _json_loads(body)["result"]
+        self.metrics.token_refreshes += 1
+
+        access_token = token_data["accessToken"]
+        expires_at = _jwt_expiry(access_token)
+        if expires_at is None and "expireInSeconds" in token_data:
+            expires_at = time.time() + token_data["expireInSeconds"]
+        return access_token, expires_at
 
-        self._access_token = token_data.result.accessToken
-        self._auth_header = {"Authorization": f"Bearer {self._access_token}"}
+    async def _request(
+        self,
+        url,
+        requesttype,
+        json_data=None,
+        retry=RETRY_ATTEMPTS,
+        priority=RequestPriority.POLL,
+    ):
+        """Send a request and return the decoded JSON body.
 
-    async def _request(self, url, requesttype, json_data=None, retry=3):
-        if self._access_token is None:
-            await self._getAccessToken(self)
+        Failed requests are retried up to ``retry`` times with exponential
+        backoff, and fail straight away with EbecoCircuitOpenError while the
+        circuit breaker considers the API to be down. Waiting for a token and
+        for the rate limiter, every attempt and the backoff in between share
+        one deadline, after which EbecoDeadlineExceeded is raised.
+
+        A read of a URL that is already waiting to be sent, in the same or a
+        more urgent lane, shares the answer of that read. A more urgent read
+        takes over from a waiting one instead, which then shares its answer.
+        When a read is cancelled or runs out of time, the reads sharing it
+        send it again within their own deadlines.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
         try:
-            async with asyncio.timeout(self._timeout):
-                if json_data:
-                    if requesttype == RequestType.GET:
-                        response = await self.websession.get(
-                            url, json=json_data, headers=self._auth_header
-                        )
-                    elif requesttype == RequestType.POST:
-                        response = await self.websession.post(
-                            url, json=json_data, headers=self._auth_header
-                        )
-                    else:
-                        response = await self.websession.put(
-                            url, json=json_data, headers=self._auth_header
-                        )
+            async with asyncio.timeout_at(deadline) as timeout:
+                if requesttype is not RequestType.GET:
+                    return await self._async_send(
+                        url, requesttype, json_data, retry, priority, deadline
+                    )
+
+                while True:
+                    queued = self._queued_reads.get(url)
+                    if queued is not None and queued.priority <= priority:
+                        try:
+                            return await self._async_share_read(queued)
+                        except _ReadAbandoned:
+                            continue
 
-                else:  # If no json_data
-                    if requesttype == RequestType.GET:
-                        response = await self.websession.get(
-                            url, headers=self._auth_header
+                    read = self._queued_reads[url] = _QueuedRead(priority, loop)
+                    if queued is not None and not queued.superseded.done():
+                        queued.superseded.set_result(read)
+                    try:
+                        result = await self._async_send(
+                            url, requesttype, json_data, retry, priority, deadline, read
                         )
-                    elif requesttype == RequestType.POST:
-                        response = await self.websession.post(
-                            url, headers=self._auth_header
+                    except _ReadAbandoned as err:
+                        # The read this one shared was given up, send it again
+                        read.set_exception(err)
+                        continue
+                    except (asyncio.CancelledError, EbecoDeadlineExceeded):
+                        read.set_exception(
+                            _ReadAbandoned(f"Read of {url} was given up")
                         )
+                        raise
+                    except Exception as err:
+                        read.set_exception(err)
+                        raise
+                    finally:
+                        if self._queued_reads.get(url) is read:
+                            del self._queued_reads[url]
+                    read.set_result(result)
+                    return result
+        except TimeoutError as err:
+            if timeout.expired():
+                raise EbecoDeadlineExceeded(
+                    f"{_endpoint_name(url)} did not finish within"
+                    f" {self.deadline} seconds"
+                ) from err
+            raise
+
+    def _record_error(
+        self, method, started, url=None, request=None, timeout=False
+    ) -> None:
+        # Only failures of the request itself, not of e.g. the login before it
+        if self.recorder is None or started is None:
+            return
+        self.recorder.record_error(
+            method,
+            url or f"{self._api_url}/TokenAuth",
+            time.monotonic() - started,
+            timeout=timeout,
+            request=request,
+        )
+
+    async def _async_share_read(self, read):
+        """Return the answer of a read that is waiting to be sent or was sent."""
+        self.metrics.shared_reads += 1
+        if read.outcome is not None:
+            result, err = read.outcome
+            if err is not None:
+                raise err
+            return result
+        waiter = asyncio.get_running_loop().create_future()
+        read.waiters.append(waiter)
+        return await waiter
+
+    async def _async_acquire_read(self, read, priority):
+        """Wait for the turn of a read, or return the read that took over."""
+        acquire = asyncio.ensure_future(self.rate_limiter.async_acquire(priority))
+        try:
+            await asyncio.wait(
+                (acquire, read.superseded), return_when=asyncio.FIRST_COMPLETED
+            )
+        except BaseException:
+            acquire.cancel()
+            raise
+        if acquire.done():
+            acquire.result()
+            return None
+        acquire.cancel()
+        return read.superseded.result()
+
+    async def _async_send(
+        self, url, requesttype, json_data, retry, priority, deadline, read=None
+    ):
+        """Send a request, retrying it until it succeeds or runs out of time.
+
+        The body is read and the connection released inside the timeout, so a
+        slow response can not hold on to a pooled connection. read is the
+        queued read the request is for, if it is one.
+        """
+        loop = asyncio.get_running_loop()
+        endpoint = _endpoint_name(url)
+        self.circuit_breaker.before_request()
+        # Let through while the circuit is open, so this call is the probe
+        probing = self.circuit_breaker.is_open
+        # If the last attempt sent failed because the API is down, None until
+        # an attempt was sent. The circuit breaker is told the outcome of the
+        # call rather than of every attempt, so the retries of a single call
+        # can not open the circuit.
+        outage = None
+        error = None
+        try:
+            for attempt in range(retry + 1):
+                if attempt:
+                    if self.circuit_breaker.is_open and not probing:
+                        # Another call opened the circuit, report what went
+                        # wrong with this one
+                        break
+                    self.metrics.retries += 1
+                    delay = _backoff_delay(attempt - 1) if backoff else 0
+                    if loop.time() + delay >= deadline:
+                        raise EbecoDeadlineExceeded(
+                            f"No time left to retry {endpoint} within"
+                            f" {self.deadline} seconds"
+                        ) from error
+                    if delay:
+                        await asyncio.sleep(delay)
+
+                started = None
+                try:
+                    access_token = await self._token_manager.async_get_token()
+                    if read is None:
+                        await self.rate_limiter.async_acquire(priority)
                     else:
-                        response = await self.websession.put(
-                            url, headers=self._auth_header
+                        if (
+                            attempt
+                            and url not in self._queued_reads
+                            and not read.superseded.done()
+                        ):
+                            # Waiting again, later reads can share the retry
+                            self._queued_reads[url] = read
+                        newer = await self._async_acquire_read(read, priority)
+                        if newer is not None:
+                            outage = None
+                            return await self._async_share_read(newer)
+                        if self._queued_reads.get(url) is read:
+                            # Reads from now on need an answer sent after them
+                            del self._queued_reads[url]
+                    started = time.monotonic()
+                    async with asyncio.timeout(self._timeout):
+                        async with self.websession.request(
+                            requesttype.name,
+                            url,
+                            json=json_data or None,
+                            headers={"Authorization": f"Bearer {access_token}"},
+                        ) as response:
+                            status = response.status
+                            retry_after = _retry_after(response)
+                            body = await response.read() if status == 200 else None
+                except asyncio.TimeoutError as err:
+                    # A failed login was already counted under TokenAuth
+                    if started is not None:
+                        self.metrics.record_failure(endpoint, timeout=True)
+                        self._record_error(
+                            requesttype.name,
+                            started,
+                            url,
+                            json_data or None,
+                            timeout=True,
                         )
+                        outage = True
+                    error = err
+                    backoff = True
+                    continue
+                except aiohttp.ClientError as err:
+                    if started is not None:
+                        self.metrics.record_failure(endpoint)
+                        self._record_error(
+                            requesttype.name, started, url, json_data or None
+                        )
+                        outage = _is_outage(err)
+                        if not outage:
+                            self.circuit_breaker.record_success()
+                    if not _is_outage(err):
+                        # Rejected, e.g. the login, and would be again
+                        raise
+                    error = err
+                    backoff = True
+                    continue
 
-            if response.status != 200:
-                if response.status != HTTPStatus.TOO_MANY_REQUESTS:
-                    # No need to reset token if we're simply being rate limited
-                    self._access_token = None
-
-                if retry > 0:
-                    await asyncio.sleep(1)
-                    return await self._request(
-                        url, requesttype, json_data, retry=retry - 1
+                error = None
+                elapsed = time.monotonic() - started
+                self.metrics.record_response(
+                    endpoint, elapsed, status, len(body or b"")
+                )
+                if self.recorder is not None:
+                    self.recorder.record(
+                        requesttype.name,
+                        url,
+                        status,
+                        elapsed,
+                        body,
+                        retry_after,
+                        json_data or None,
                     )
-                return None
-        except aiohttp.ClientError:
-            self._access_token = None
-            if retry > 0:
-                return await self._request(url, requesttype, json_data, retry=retry - 1)
-            raise
-        except asyncio.TimeoutError:
-            self._access_token = None
-            if retry > 0:
-                return await self._request(url, requesttype, json_data, retry=retry - 1)
+                outage = status >= HTTPStatus.INTERNAL_SERVER_ERROR
+                if not outage:
+                    self.circuit_breaker.record_success()
+                if status == 200:
+                    return _json_loads(body) if body else None
 
+                backoff = True
+                if status == HTTPStatus.TOO_MANY_REQUESTS:
+                    # The limiter holds back the retry and every other request
+                    self.rate_limiter.block_for(
+                        1 if retry_after is None else retry_after
+                    )
+                    backoff = False
+                elif status in (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN):
+                    # Only a rejected token needs a new login, which can be
+                    # retried straight away
+                    await self._token_manager.async_invalidate(access_token)
+                    backoff = False
+        except asyncio.CancelledError:
+            # Given up without an outcome
+            outage = None
             raise
-        return response
+        finally:
+            if outage:
+                self.circuit_breaker.record_failure()
+            elif outage is None:
+                self.circuit_breaker.release()
+        if error is not None:
+            raise error
+        return None
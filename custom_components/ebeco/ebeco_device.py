@@ -1,9 +1,16 @@
 """Wrap a single Ebeco device and the API to communicate with it."""
 
+import asyncio
+import itertools
 import logging
+import time
 
-from .const import EbecoClimateActions
-from .data_handler import EbecoApi
+from .const import (
+    PENDING_CHANGE_TIMEOUT_SECONDS,
+    WRITE_DEBOUNCE_SECONDS,
+    EbecoClimateActions,
+)
+from .data_handler import WRITABLE_FIELDS, EbecoApi, EbecoDeviceState
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -13,17 +20,102 @@ class EbecoDevice:
 
     def __init__(self, device_id, ebeco_data_handler: EbecoApi) -> None:
         self._device_id = device_id
-        self._device = {}
+        self._device: EbecoDeviceState | None = None
         self._ebeco_data_handler = ebeco_data_handler
+        self._pending_changes = {}
+        self._pending_waiters = []
+        self._flush_handle = None
+        self._flush_tasks = set()
+        self._write_lock = asyncio.Lock()
+        # Written values the API has not reported yet, by API field name, with
+        # the time they are given up on
+        self._pending_fields = {}
+        # Every fetch and write of the device gets a version, so a fetch that
+        # started before a write can be told apart from one started after it
+        self._versions = itertools.count(1)
+        self._fetched_version = 0
+        # Version of the last acknowledged write of each field, for writes that
+        # no applied fetch has started after yet
+        self._write_versions = {}
 
     async def get_device(self):
         """Get device."""
 
         return self._device
 
+    def set_device(self, data: EbecoDeviceState) -> None:
+        """Store device data fetched by the account coordinator."""
+        self._device = data
+
+    @property
+    def has_pending_changes(self) -> bool:
+        """Return if there are written values the API has not reported yet."""
+        return bool(self._pending_fields)
+
+    def begin_fetch(self) -> int:
+        """Return the version to pass to reconcile with the fetched data."""
+        return next(self._versions)
+
+    def reconcile(self, data: EbecoDeviceState, version=None) -> EbecoDeviceState:
+        """Return fetched data with the values still waiting to be applied.
+
+        The device takes a while to apply a change, so the API can keep
+        reporting the old value for a bit. Written values are shown until the
+        API reports them or they time out.
+
+        version is the one from begin_fetch when the fetch started. Data from
+        a fetch older than one already applied is dropped, and fields written
+        after the fetch started keep their current value.
+        """
+        current = self._device
+        stale = {}
+        if version is not None and current is not None:
+            if version < self._fetched_version:
+                _LOGGER.debug("Dropping outdated data of device %s", self._device_id)
+                return current
+            self._fetched_version = version
+            for field, write_version in list(self._write_versions.items()):
+                if write_version > version:
+                    written = self._pending_fields.get(field)
+                    stale[field] = (
+                        written[0]
+                        if written is not None
+                        else getattr(current, WRITABLE_FIELDS[field])
+                    )
+                else:
+                    del self._write_versions[field]
+        if not self._pending_fields and not stale:
+            return data
+
+        now = time.monotonic()
+        pending = {}
+        for field, (value, expires_at) in list(self._pending_fields.items()):
+            if field in stale:
+                # Fetched before the write, so it tells nothing about it
+                continue
+            if getattr(data, WRITABLE_FIELDS[field]) == value:
+                _LOGGER.debug("Device %s applied %s=%s", self._device_id, field, value)
+                del self._pending_fields[field]
+            elif now >= expires_at:
+                _LOGGER.warning(
+                    "Device %s did not apply %s=%s, it reports %s",
+                    self._device_id,
+                    field,
+                    value,
+                    getattr(data, WRITABLE_FIELDS[field]),
+                )
+                del self._pending_fields[field]
+            else:
+                pending[field] = value
+        pending.update(stale)
+        return data.with_changes(pending) if pending else data
+
     async def async_get(self):
         """Get updated data for device."""
+        version = self.begin_fetch()
         data = await self._ebeco_data_handler.fetch_user_device(self._device_id)
+        if data is not None:
+            data = self.reconcile(data, version)
         self._device = data
         return data
 
@@ -33,10 +125,9 @@ class EbecoDevice:
         action = changes["action"]
 
         # The time between the API receiving the request and the device apply
-        # the changes seems to take a bit longer time than we want, and the
-        # coordinator has time to reset back to the previous value. So instead
-        # we fake the correct changes being applied and wait for the next
-        # scheduled refresh to take place
+        # the changes seems to take a bit longer time than we want, so the
+        # written values are kept on top of fetched data until the API reports
+        # them, see reconcile
         try:
             if action == EbecoClimateActions.SET_POWERSTATE:
                 await self.set_powerstate(changes["state"])
@@ -53,34 +144,68 @@ class EbecoDevice:
 
         return True
 
+    async def async_update_device(self, changes, delay=WRITE_DEBOUNCE_SECONDS) -> None:
+        """Send changes to the device.
+
+        Changes made within delay seconds are merged into a single request,
+        where the last value written to a field wins. Every caller waits until
+        the request carrying its changes has completed.
+        """
+        loop = asyncio.get_running_loop()
+        self._pending_changes.update(changes)
+        waiter = loop.create_future()
+        self._pending_waiters.append(waiter)
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(delay, self._start_flush)
+        await waiter
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        changes, waiters = self._pending_changes, self._pending_waiters
+        self._pending_changes, self._pending_waiters = {}, []
+        task = asyncio.ensure_future(self._async_flush(changes, waiters))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _async_flush(self, changes, waiters) -> None:
+        json_data = {"id": self._device_id, **changes}
+        _LOGGER.debug("Sending merged changes %s", json_data)
+        # Keep requests for the device in the order the changes were made
+        async with self._write_lock:
+            version = next(self._versions)
+            try:
+                await self._ebeco_data_handler.update_user_device(json_data)
+            except Exception as err:  # pylint: disable=broad-except
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(err)
+                return
+
+        expires_at = time.monotonic() + PENDING_CHANGE_TIMEOUT_SECONDS
+        for field, value in changes.items():
+            self._pending_fields[field] = (value, expires_at)
+            self._write_versions[field] = version
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
     async def set_room_target_temperature(self, temperature, heating_enabled):
         """Set target temperature for room."""
-
-        json_data = {
-            "id": self._device_id,
-            "powerOn": heating_enabled,
-            "temperatureSet": temperature,
-        }
-
-        await self._ebeco_data_handler.set_room_target_temperature(json_data)
-
-        self._device["powerOn"] = heating_enabled
-        self._device["temperatureSet"] = temperature
+        await self.async_apply(
+            {"powerOn": heating_enabled, "temperatureSet": temperature}
+        )
 
     async def set_powerstate(self, heating_enabled):
         """Set power state."""
-        json_data = {
-            "id": self._device_id,
-            "powerOn": heating_enabled,
-        }
-        await self._ebeco_data_handler.set_powerstate(json_data)
-        self._device["powerOn"] = heating_enabled
+        await self.async_apply({"powerOn": heating_enabled})
 
     async def set_preset_mode(self, preset_mode):
         """Set preset mode."""
-        json_data = {
-            "id": self._device_id,
-            "selectedProgram": preset_mode,
-        }
-        await self._ebeco_data_handler.set_preset_mode(json_data)
-        self._device["selectedProgram"] = preset_mode
+        await self.async_apply({"selectedProgram": preset_mode})
+
+    async def async_apply(self, changes, delay=WRITE_DEBOUNCE_SECONDS) -> None:
+        """Send changes, keyed by API field name, and show them right away."""
+        await self.async_update_device(changes, delay)
+        if self._device is not None:
+            self._device = self._device.with_changes(changes)
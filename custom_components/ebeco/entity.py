@@ -1,31 +1,119 @@
 """Ebeco parent entity class."""
 
-from homeassistant.helpers.entity import DeviceInfo
+from collections.abc import Callable, Iterable
+from functools import partial
+from operator import attrgetter
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import DeviceInfo, Entity
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import DOMAIN
+from .const import DOMAIN, SIGNAL_NEW_DEVICES
+from .data_handler import EbecoDeviceState
+
+
+@callback
+def async_setup_device_entities(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities,
+    create_entities: Callable[[dict, EbecoDeviceState], Iterable[Entity]],
+) -> None:
+    """Add the entities of every device of an entry, now and when added later."""
+    instance = hass.data[DOMAIN][config_entry.entry_id]
+
+    @callback
+    def async_add_devices(device_ids) -> None:
+        data = instance["coordinator"].data
+        async_add_entities(
+            entity
+            for device_id in device_ids
+            if device_id in data
+            for entity in create_entities(instance, data[device_id])
+        )
+
+    async_add_devices(instance["device_ids"])
+    config_entry.async_on_unload(
+        async_dispatcher_connect(
+            hass, SIGNAL_NEW_DEVICES.format(config_entry.entry_id), async_add_devices
+        )
+    )
 
 
 class EbecoEntity(CoordinatorEntity):
     """Parent class for Ebeco Entities."""
 
+    # Snapshot attributes, besides the name, the state of the entity is
+    # derived from. The state is only written when one of them changes.
+    _state_fields: tuple[str, ...] = ()
+
     def __init__(self, instance, device_key, main_sensor) -> None:
         """Initialize common aspects of an Ebeco sensor."""
         super().__init__(instance["coordinator"])
-        self.async_change = instance["async_change"]
+        self.async_change = partial(instance["async_change"], device_key)
         self.device_key = device_key
+        self._data_key = str(device_key)
+        self._last_device = self.coordinator.data[self._data_key]
         self._attr_device_info = DeviceInfo(
             identifiers={(DOMAIN, device_key)},
             manufacturer="Ebeco",
-            name=self._device["displayName"],
+            name=self._device.display_name,
             suggested_area="Bathroom",
         )
+        self._state_inputs = attrgetter("display_name", *self._state_fields)
+        self._last_inputs = self._current_inputs()
 
     @property
     def building(self):
         """Which building this entity is installed in."""
-        return self._device["building"]["name"]
+        return self._device.building
+
+    @property
+    def available(self) -> bool:
+        """Return if the device is still reported by the Ebeco account.
+
+        Stays available while refreshes fail, until the data is older than
+        the stale window of the coordinator.
+        """
+        return (
+            self.coordinator.data_available and self._data_key in self.coordinator.data
+        )
+
+    @property
+    def _device(self) -> EbecoDeviceState:
+        # Fall back to the last known data if the device disappears from the
+        # account, so name and unique id can still be resolved.
+        data = self.coordinator.data.get(self._data_key)
+        if data is not None:
+            self._last_device = data
+        return self._last_device
 
     @property
-    def _device(self):
-        return self.coordinator.data
+    def extra_state_attributes(self):
+        """Flag data that is not current, saved before a restart or not refreshed.
+
+        data_age is the number of seconds since the data was fetched, before
+        the restart for saved data.
+        """
+        if self.coordinator.stale:
+            return {"stale": True, "data_age": self.coordinator.data_age}
+        return None
+
+    def _current_inputs(self):
+        return (
+            self.available,
+            self.coordinator.stale,
+            self.coordinator.data_age if self.coordinator.stale else None,
+            self._state_inputs(self._device),
+        )
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only if something it is derived from changed."""
+        inputs = self._current_inputs()
+        if inputs == self._last_inputs:
+            return
+        self._last_inputs = inputs
+        self.async_write_ha_state()
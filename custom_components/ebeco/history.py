@@ -0,0 +1,155 @@
+"""Rolling history of the relay and temperatures of an Ebeco thermostat.
+
+Samples are kept in fixed size arrays used as a ring buffer, and the time the
+relay was on is summed per window as samples are added, so the rolling
+statistics cost the same however long the window is. Kept free of Home
+Assistant imports so the scripts can use it on their own.
+"""
+
+from array import array
+import math
+
+# Windows in seconds the rolling statistics are kept for
+HISTORY_WINDOWS = (15 * 60, 60 * 60, 24 * 60 * 60)
+# Samples kept per device, a day of polls at the regular interval with room to
+# spare. When polls are more frequent the longest window covers less time.
+HISTORY_SAMPLES = 2048
+
+
+class _Window:
+    """Running sum of the time the relay was on within a window."""
+
+    __slots__ = ("seconds", "head", "heated")
+
+    def __init__(self, seconds) -> None:
+        self.seconds = seconds
+        # Sample in effect at the start of the window, or the oldest sample
+        self.head = 0
+        # Seconds the relay was on from the head sample to the last sample
+        self.heated = 0.0
+
+
+class EbecoDeviceHistory:
+    """Timestamped relay and temperature samples of a single device.
+
+    The relay and temperatures reported by a poll are assumed to hold until
+    the next poll. Timestamps are in seconds, from any monotonic clock, and
+    statistics are asked for at times that do not go backwards.
+    """
+
+    def __init__(self, capacity=HISTORY_SAMPLES, windows=HISTORY_WINDOWS) -> None:
+        """Init an empty history."""
+        self.capacity = capacity
+        self._times = array("d", [0.0]) * capacity
+        self._relay = array("b", [0]) * capacity
+        self._floor = array("f", [math.nan]) * capacity
+        self._room = array("f", [math.nan]) * capacity
+        # Samples ever added, sample n is kept at n % capacity
+        self._count = 0
+        self._windows = {seconds: _Window(seconds) for seconds in windows}
+
+    def __len__(self) -> int:
+        """Return the number of samples kept."""
+        return min(self._count, self.capacity)
+
+    @property
+    def added(self) -> int:
+        """Return the number of samples ever added."""
+        return self._count
+
+    @property
+    def windows(self):
+        """Return the windows, in seconds, statistics are kept for."""
+        return tuple(self._windows)
+
+    def add(self, at, relay_on, temperature_floor=None, temperature_room=None):
+        """Add the state of the device at a point in time."""
+        last = self._count - 1
+        if last >= 0:
+            last_time = self._times[last % self.capacity]
+            if at <= last_time:
+                # Out of order, or the same poll twice
+                return
+            if self._relay[last % self.capacity]:
+                for window in self._windows.values():
+                    window.heated += at - last_time
+            if self._count >= self.capacity:
+                # The oldest sample is about to be overwritten
+                oldest = self._count - self.capacity
+                for window in self._windows.values():
+                    if window.head == oldest:
+                        self._advance(window)
+
+        index = self._count % self.capacity
+        self._times[index] = at
+        self._relay[index] = bool(relay_on)
+        self._floor[index] = (
+            math.nan if temperature_floor is None else temperature_floor
+        )
+        self._room[index] = math.nan if temperature_room is None else temperature_room
+        self._count += 1
+        for window in self._windows.values():
+            self._trim(window, at)
+
+    def duty_cycle(self, window, now):
+        """Return the share of a window, up to now, the relay was on."""
+        window = self._window(window, now)
+        if window is None:
+            return None
+        last = (self._count - 1) % self.capacity
+        head = window.head % self.capacity
+        last_time = self._times[last]
+        now = max(now, last_time)
+        start = max(now - window.seconds, self._times[head])
+        heated = window.heated
+        if self._relay[last]:
+            heated += now - last_time
+        if self._relay[head]:
+            # Only the part of the head sample within the window counts
+            heated -= start - self._times[head]
+        covered = now - start
+        if covered <= 0:
+            return None
+        return min(max(heated / covered, 0.0), 1.0)
+
+    def heating_rate(self, window, now, sensor="floor"):
+        """Return the change of a temperature over a window in degrees per hour.
+
+        sensor is floor or room. None is returned until the window holds two
+        samples with a temperature.
+        """
+        window = self._window(window, now)
+        if window is None or window.head == self._count - 1:
+            return None
+        temperatures = self._floor if sensor == "floor" else self._room
+        head = window.head % self.capacity
+        last = (self._count - 1) % self.capacity
+        first = temperatures[head]
+        current = temperatures[last]
+        if math.isnan(first) or math.isnan(current):
+            return None
+        return (current - first) / (self._times[last] - self._times[head]) * 3600
+
+    def _window(self, seconds, now):
+        if not self._count:
+            return None
+        window = self._windows[seconds]
+        self._trim(window, now)
+        return window
+
+    def _trim(self, window, now) -> None:
+        """Move the head of a window up to the sample in effect at its start."""
+        start = now - window.seconds
+        last = self._count - 1
+        while (
+            window.head < last
+            and self._times[(window.head + 1) % self.capacity] <= start
+        ):
+            self._advance(window)
+
+    def _advance(self, window) -> None:
+        head = window.head % self.capacity
+        if self._relay[head]:
+            following = (window.head + 1) % self.capacity
+            window.heated -= self._times[following] - self._times[head]
+        window.head += 1
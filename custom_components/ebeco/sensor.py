@@ -1,5 +1,12 @@
 """Support power, energy and temperature measurement for Ebeco wifi-enabled thermostats."""
 
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+import hashlib
+from operator import attrgetter
+import time
+
 from homeassistant.components.binary_sensor import (
     BinarySensorDeviceClass,
     BinarySensorEntity,
@@ -7,16 +14,201 @@ from homeassistant.components.binary_sensor import (
 from homeassistant.components.sensor import (
     SensorDeviceClass,
     SensorEntity,
+    SensorEntityDescription,
     SensorStateClass,
     StateType,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import UnitOfEnergy, UnitOfPower, UnitOfTemperature
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.entity import EntityCategory
+from homeassistant.const import (
+    PERCENTAGE,
+    UnitOfEnergy,
+    UnitOfInformation,
+    UnitOfPower,
+    UnitOfTemperature,
+    UnitOfTime,
+)
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.device_registry import DeviceEntryType
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
+from homeassistant.helpers.event import async_track_time_interval
 
 from .const import DOMAIN as EBECO_DOMAIN, MAIN_SENSOR
-from .entity import EbecoEntity
+from .data_handler import EbecoApiMetrics, EbecoDeviceState
+from .entity import EbecoEntity, async_setup_device_entities
+from .history import HISTORY_WINDOWS, EbecoDeviceHistory
+
+# Rolling statistics shown by default, the others are disabled until enabled
+DEFAULT_HISTORY_WINDOW = 60 * 60
+# How often rolling statistics move on with time between polls of the API
+HISTORY_UPDATE_INTERVAL = timedelta(minutes=5)
+
+
+def _milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000)
+
+
+@dataclass(frozen=True, kw_only=True)
+class EbecoApiMetricDescription(SensorEntityDescription):
+    """Describes a sensor showing one of the API metrics of an account."""
+
+    value_fn: Callable[[EbecoApiMetrics], StateType]
+    attributes_fn: Callable[[EbecoApiMetrics], dict] | None = None
+
+
+API_METRIC_SENSORS = (
+    EbecoApiMetricDescription(
+        key="requests",
+        name="API requests",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.requests,
+        attributes_fn=lambda metrics: {
+            endpoint: endpoint_metrics.requests
+            for endpoint, endpoint_metrics in metrics.endpoints.items()
+        },
+    ),
+    EbecoApiMetricDescription(
+        key="errors",
+        name="API errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.errors,
+        attributes_fn=lambda metrics: {
+            endpoint: endpoint_metrics.errors
+            for endpoint, endpoint_metrics in metrics.endpoints.items()
+        },
+    ),
+    EbecoApiMetricDescription(
+        key="latency_p50",
+        name="API latency median",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda metrics: _milliseconds(metrics.latency_percentile(50)),
+    ),
+    EbecoApiMetricDescription(
+        key="latency_p95",
+        name="API latency 95th percentile",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda metrics: _milliseconds(metrics.latency_percentile(95)),
+        # Latency histograms since start, per endpoint
+        attributes_fn=lambda metrics: {
+            endpoint: endpoint_metrics.as_dict()["latency_buckets"]
+            for endpoint, endpoint_metrics in metrics.endpoints.items()
+        },
+    ),
+    EbecoApiMetricDescription(
+        key="retries",
+        name="API retries",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.retries,
+    ),
+    EbecoApiMetricDescription(
+        key="timeouts",
+        name="API timeouts",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.timeouts,
+    ),
+    EbecoApiMetricDescription(
+        key="rate_limited",
+        name="API rate limited requests",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.rate_limited,
+    ),
+    EbecoApiMetricDescription(
+        key="token_refreshes",
+        name="API token refreshes",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.token_refreshes,
+    ),
+    EbecoApiMetricDescription(
+        key="shared_reads",
+        name="API shared reads",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.shared_reads,
+    ),
+    EbecoApiMetricDescription(
+        key="bytes_received",
+        name="API data received",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.bytes_received,
+    ),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class EbecoHistorySensorDescription(SensorEntityDescription):
+    """Describes a sensor showing a rolling statistic of a thermostat."""
+
+    window: int
+    value_fn: Callable[
+        [EbecoDeviceHistory, int, float, EbecoDeviceState, str], StateType
+    ]
+
+
+def _window_name(seconds):
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 60}min"
+
+
+def _duty_cycle(history, window, now, device, sensor):
+    duty_cycle = history.duty_cycle(window, now)
+    if duty_cycle is None:
+        return None
+    return round(duty_cycle * 100, 1)
+
+
+def _mean_power(history, window, now, device, sensor):
+    duty_cycle = history.duty_cycle(window, now)
+    if duty_cycle is None:
+        return None
+    return round(duty_cycle * device.installed_effect, 1)
+
+
+def _heating_rate(history, window, now, device, sensor):
+    heating_rate = history.heating_rate(window, now, sensor)
+    if heating_rate is None:
+        return None
+    return round(heating_rate, 2)
+
+
+HISTORY_SENSORS = tuple(
+    description
+    for window in HISTORY_WINDOWS
+    for description in (
+        EbecoHistorySensorDescription(
+            key=f"duty-cycle-{_window_name(window)}",
+            name=f"Duty Cycle {_window_name(window)}",
+            native_unit_of_measurement=PERCENTAGE,
+            state_class=SensorStateClass.MEASUREMENT,
+            entity_registry_enabled_default=window == DEFAULT_HISTORY_WINDOW,
+            window=window,
+            value_fn=_duty_cycle,
+        ),
+        EbecoHistorySensorDescription(
+            key=f"mean-power-{_window_name(window)}",
+            name=f"Mean Power {_window_name(window)}",
+            device_class=SensorDeviceClass.POWER,
+            native_unit_of_measurement=UnitOfPower.WATT,
+            state_class=SensorStateClass.MEASUREMENT,
+            entity_registry_enabled_default=window == DEFAULT_HISTORY_WINDOW,
+            window=window,
+            value_fn=_mean_power,
+        ),
+        EbecoHistorySensorDescription(
+            key=f"heating-rate-{_window_name(window)}",
+            name=f"Heating Rate {_window_name(window)}",
+            native_unit_of_measurement=f"{UnitOfTemperature.CELSIUS}/h",
+            state_class=SensorStateClass.MEASUREMENT,
+            entity_registry_enabled_default=window == DEFAULT_HISTORY_WINDOW,
+            window=window,
+            value_fn=_heating_rate,
+        ),
+    )
+)
 
 
 async def async_setup_entry(
@@ -26,21 +218,35 @@ async def async_setup_entry(
 
     instance = hass.data[EBECO_DOMAIN][config_entry.entry_id]
     sensor = config_entry.data[MAIN_SENSOR]
-    device_data = instance["coordinator"].data
-    dev = []
-    dev.append(EbecoRelaySensor(instance, device_data, sensor))
-    dev.append(EbecoPowerSensor(instance, device_data, sensor))
-    dev.append(EbecoInstalledPowerSensor(instance, device_data, sensor))
-    dev.append(EbecoEnergySensor(instance, device_data, sensor))
-    dev.append(EbecoTemperatureSensor(instance, device_data, "Floor"))
-    dev.append(EbecoTemperatureSensor(instance, device_data, "Room"))
-    async_add_entities(dev)
+
+    def create_entities(instance, device_data):
+        dev = []
+        dev.append(EbecoRelaySensor(instance, device_data, sensor))
+        dev.append(EbecoPowerSensor(instance, device_data, sensor))
+        dev.append(EbecoInstalledPowerSensor(instance, device_data, sensor))
+        dev.append(EbecoEnergySensor(instance, device_data, sensor))
+        dev.append(EbecoTemperatureSensor(instance, device_data, "Floor"))
+        dev.append(EbecoTemperatureSensor(instance, device_data, "Room"))
+        dev.extend(
+            EbecoHistorySensor(instance, device_data, sensor, description)
+            for description in HISTORY_SENSORS
+        )
+        return dev
+
+    async_setup_device_entities(hass, config_entry, async_add_entities, create_entities)
+    if instance["api_metrics"]:
+        async_add_entities(
+            EbecoApiMetricSensor(instance, description)
+            for description in API_METRIC_SENSORS
+        )
 
 
 class EbecoRelaySensor(EbecoEntity, BinarySensorEntity):
+    _state_fields = ("relay_on",)
+
     def __init__(self, instance, device_data, sensor) -> None:
         """Initialize the thermostat."""
-        super().__init__(instance, device_data["id"], sensor)
+        super().__init__(instance, device_data.id, sensor)
 
     @property
     def device_class(self) -> str:
@@ -54,23 +260,25 @@ class EbecoRelaySensor(EbecoEntity, BinarySensorEntity):
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return f"{self._device['id']}-relay"
+        return f"{self._device.id}-relay"
 
     @property
     def name(self):
         """Return the name of the device, if any."""
-        return f"{self._device['displayName']} Relay"
+        return f"{self._device.display_name} Relay"
 
     @property
     def is_on(self) -> bool:
         """Return the state of the entity."""
-        return self._device["relayOn"] is True
+        return self._device.relay_on
 
 
 class EbecoPowerSensor(EbecoEntity, SensorEntity):
+    _state_fields = ("relay_on", "installed_effect")
+
     def __init__(self, instance, device_data, sensor) -> None:
         """Initialize the thermostat."""
-        super().__init__(instance, device_data["id"], sensor)
+        super().__init__(instance, device_data.id, sensor)
         self.main_sensor = MAIN_SENSOR
 
     @property
@@ -86,12 +294,12 @@ class EbecoPowerSensor(EbecoEntity, SensorEntity):
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return f"{self._device['id']}-power"
+        return f"{self._device.id}-power"
 
     @property
     def name(self):
         """Return the name of the device, if any."""
-        return f"{self._device['displayName']} Power"
+        return f"{self._device.display_name} Power"
 
     @property
     def entity_category(self) -> str:
@@ -105,11 +313,11 @@ class EbecoPowerSensor(EbecoEntity, SensorEntity):
     @property
     def installed_power(self):
         """Return the installed power in Watts."""
-        return self._device["installedEffect"]
+        return self._device.installed_effect
 
     def is_on(self) -> bool:
         """Return the state of the relay."""
-        return self._device["relayOn"] is True
+        return self._device.relay_on
 
     @property
     def native_value(self) -> StateType:
@@ -121,9 +329,11 @@ class EbecoPowerSensor(EbecoEntity, SensorEntity):
 
 
 class EbecoInstalledPowerSensor(EbecoEntity, SensorEntity):
+    _state_fields = ("installed_effect",)
+
     def __init__(self, instance, device_data, sensor) -> None:
         """Initialize the thermostat."""
-        super().__init__(instance, device_data["id"], sensor)
+        super().__init__(instance, device_data.id, sensor)
         self.main_sensor = MAIN_SENSOR
 
     @property
@@ -139,12 +349,12 @@ class EbecoInstalledPowerSensor(EbecoEntity, SensorEntity):
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return f"{self._device['id']}-installed-power"
+        return f"{self._device.id}-installed-power"
 
     @property
     def name(self):
         """Return the name of the device, if any."""
-        return f"{self._device['displayName']} Installed Power"
+        return f"{self._device.display_name} Installed Power"
 
     @property
     def entity_category(self) -> str:
@@ -158,7 +368,7 @@ class EbecoInstalledPowerSensor(EbecoEntity, SensorEntity):
     @property
     def installed_power(self):
         """Return the installed power in Watts."""
-        return self._device["installedEffect"]
+        return self._device.installed_effect
 
     @property
     def native_value(self) -> StateType:
@@ -167,13 +377,14 @@ class EbecoInstalledPowerSensor(EbecoEntity, SensorEntity):
 
 
 class EbecoEnergySensor(EbecoEntity, SensorEntity):
+    _state_fields = ("todays_on_minutes", "installed_effect")
     _decimals: int = 2
     _divisor: int = 1
     _multiplier: int = 1
 
     def __init__(self, instance, device_data, sensor) -> None:
         """Initialize the thermostat energy sensor."""
-        super().__init__(instance, device_data["id"], sensor)
+        super().__init__(instance, device_data.id, sensor)
         self.main_sensor = MAIN_SENSOR
 
     @property
@@ -189,12 +400,12 @@ class EbecoEnergySensor(EbecoEntity, SensorEntity):
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return f"{self._device['id']}-energy"
+        return f"{self._device.id}-energy"
 
     @property
     def name(self):
         """Return the name of the device, if any."""
-        return f"{self._device['displayName']} Energy Usage"
+        return f"{self._device.display_name} Energy Usage"
 
     @property
     def native_unit_of_measurement(self) -> str:
@@ -204,12 +415,12 @@ class EbecoEnergySensor(EbecoEntity, SensorEntity):
     @property
     def todays_on_minutes(self):
         """Return the number of minutes it has been running today."""
-        return self._device["todaysOnMinutes"]
+        return self._device.todays_on_minutes
 
     @property
     def installed_power(self):
         """Return the installed power in Watts."""
-        return self._device["installedEffect"]
+        return self._device.installed_effect
 
     @property
     def native_value(self) -> StateType:
@@ -230,8 +441,10 @@ class EbecoEnergySensor(EbecoEntity, SensorEntity):
 class EbecoTemperatureSensor(EbecoEntity, SensorEntity):
     def __init__(self, instance, device_data, sensor) -> None:
         """Initialize the thermostat temperature sensor."""
-        super().__init__(instance, device_data["id"], sensor.lower())
+        self._state_fields = (f"temperature_{sensor.lower()}",)
+        super().__init__(instance, device_data.id, sensor.lower())
         self._sensor = sensor
+        self._temperature = attrgetter(self._state_fields[0])
 
     @property
     def device_class(self) -> str:
@@ -246,12 +459,12 @@ class EbecoTemperatureSensor(EbecoEntity, SensorEntity):
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return f"{self._device['id']}-temperature-{self._sensor}"
+        return f"{self._device.id}-temperature-{self._sensor}"
 
     @property
     def name(self):
         """Return the name of the device, if any."""
-        return f"{self._device['displayName']} {self._sensor} Temperature"
+        return f"{self._device.display_name} {self._sensor} Temperature"
 
     @property
     def native_unit_of_measurement(self) -> str:
@@ -261,8 +474,106 @@ class EbecoTemperatureSensor(EbecoEntity, SensorEntity):
     @property
     def native_value(self) -> StateType:
         """Return the state of the entity with decimals."""
-        key = f"temperature{self._sensor}"
-        key_decimals = f"{key}Decimals"
-        if key_decimals in self._device:
-            return self._device[key_decimals]
-        return self._device[key]
+        return self._temperature(self._device)
+
+
+class EbecoHistorySensor(EbecoEntity, SensorEntity):
+    """Rolling statistic of a thermostat, computed from the polls kept in memory.
+
+    The state is written when a poll adds a sample, and as the value also
+    changes as time passes, every HISTORY_UPDATE_INTERVAL in between.
+    """
+
+    entity_description: EbecoHistorySensorDescription
+
+    def __init__(self, instance, device_data, sensor, description) -> None:
+        """Initialize the rolling statistic sensor."""
+        self.entity_description = description
+        super().__init__(instance, device_data.id, sensor)
+        self._sensor = sensor
+
+    async def async_added_to_hass(self) -> None:
+        """Follow the samples added by polls, and time passing between them."""
+        await super().async_added_to_hass()
+        # Coordinator listeners are skipped when a poll returns the same data
+        self.async_on_remove(
+            self.coordinator.async_add_history_listener(self._handle_coordinator_update)
+        )
+        self.async_on_remove(
+            async_track_time_interval(
+                self.hass, self._async_window_moved, HISTORY_UPDATE_INTERVAL
+            )
+        )
+
+    @callback
+    def _async_window_moved(self, now) -> None:
+        self.async_write_ha_state()
+
+    def _current_inputs(self):
+        # Every poll adds a sample, even when the snapshot did not change
+        history = self.coordinator.history.get(self._data_key)
+        return (*super()._current_inputs(), history and history.added)
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return f"{self._device.id}-{self.entity_description.key}"
+
+    @property
+    def name(self):
+        """Return the name of the device, if any."""
+        return f"{self._device.display_name} {self.entity_description.name}"
+
+    @property
+    def native_value(self) -> StateType:
+        """Return the statistic over the window up to now."""
+        history = self.coordinator.history.get(self._data_key)
+        if history is None:
+            return None
+        return self.entity_description.value_fn(
+            history,
+            self.entity_description.window,
+            time.monotonic(),
+            self._device,
+            self._sensor,
+        )
+
+
+class EbecoApiMetricSensor(SensorEntity):
+    """Diagnostic sensor showing how the Ebeco API behaves for an account.
+
+    The metrics are plain counters on the API client, so the sensor is polled
+    instead of pushing a state for every request. The account is only
+    identified by a hash of its key, so its email is not in the names or
+    unique ids.
+    """
+
+    entity_description: EbecoApiMetricDescription
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_should_poll = True
+
+    def __init__(self, instance, description) -> None:
+        """Initialize the API metric sensor."""
+        self.entity_description = description
+        self._metrics = instance["coordinator"].api.metrics
+        account = hashlib.sha256(instance["account"].encode()).hexdigest()[:16]
+        self._attr_unique_id = f"account-{account}-{description.key}"
+        self._attr_name = f"Ebeco {description.name}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(EBECO_DOMAIN, f"account-{account}")},
+            entry_type=DeviceEntryType.SERVICE,
+            manufacturer="Ebeco",
+            name="Ebeco account",
+        )
+
+    @property
+    def native_value(self) -> StateType:
+        """Return the current value of the metric."""
+        return self.entity_description.value_fn(self._metrics)
+
+    @property
+    def extra_state_attributes(self):
+        """Return a breakdown of the metric, if there is one."""
+        if self.entity_description.attributes_fn is None:
+            return None
+        return self.entity_description.attributes_fn(self._metrics)
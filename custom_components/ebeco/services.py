@@ -0,0 +1,181 @@
+"""Services of the Ebeco integration."""
+
+import asyncio
+import logging
+
+import voluptuous as vol
+
+from homeassistant.components.climate import ATTR_PRESET_MODE, DOMAIN as CLIMATE_DOMAIN
+from homeassistant.const import ATTR_TEMPERATURE
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.helpers import config_validation as cv, entity_registry as er
+from homeassistant.helpers.service import async_extract_referenced_entity_ids
+
+from .const import (
+    ATTR_MAX_CONCURRENCY,
+    ATTR_POWER,
+    DOMAIN,
+    PRESET_MANUAL,
+    PRESET_TIMER,
+    PRESET_WEEK,
+    SERVICE_BULK_SET,
+)
+from .coordinator import EbecoCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+BULK_SET_SCHEMA = vol.All(
+    cv.make_entity_service_schema(
+        {
+            vol.Optional(ATTR_TEMPERATURE): vol.All(
+                vol.Coerce(float), vol.Range(min=5, max=35)
+            ),
+            vol.Optional(ATTR_POWER): cv.boolean,
+            vol.Optional(ATTR_PRESET_MODE): vol.In(
+                [PRESET_MANUAL, PRESET_WEEK, PRESET_TIMER]
+            ),
+            vol.Optional(ATTR_MAX_CONCURRENCY): vol.All(
+                vol.Coerce(int), vol.Range(min=1)
+            ),
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_TEMPERATURE, ATTR_POWER, ATTR_PRESET_MODE),
+)
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the services of the integration."""
+
+    async def async_bulk_set(call: ServiceCall) -> ServiceResponse:
+        """Apply the same settings to many thermostats at once."""
+        changes = _bulk_changes(call.data)
+        registry = er.async_get(hass)
+        instances = hass.data.get(DOMAIN, {})
+        results = {}
+        accounts = {}
+        selected = async_extract_referenced_entity_ids(hass, call)
+        for entity_id in sorted(selected.referenced | selected.indirectly_referenced):
+            entity = registry.async_get(entity_id)
+            if (
+                entity is None
+                or entity.platform != DOMAIN
+                or entity.domain != CLIMATE_DOMAIN
+            ):
+                if entity_id not in selected.referenced:
+                    # Devices and areas also hold e.g. the sensors of a
+                    # thermostat, only named entities are reported
+                    continue
+                results[entity_id] = {
+                    "success": False,
+                    "error": "Not an Ebeco thermostat",
+                }
+                continue
+            instance = instances.get(entity.config_entry_id)
+            if instance is None:
+                results[entity_id] = {"success": False, "error": "Not loaded"}
+                continue
+            coordinator, targets = accounts.setdefault(
+                instance["account"], (instance["coordinator"], [])
+            )
+            targets.append((entity_id, entity.unique_id))
+
+        # Accounts have separate request budgets, so they are written in
+        # parallel as well
+        await asyncio.gather(
+            *(
+                _async_bulk_set_account(
+                    coordinator,
+                    targets,
+                    changes,
+                    call.data.get(ATTR_MAX_CONCURRENCY),
+                    results,
+                )
+                for coordinator, targets in accounts.values()
+            )
+        )
+        if call.return_response:
+            return {"results": results}
+        return None
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_BULK_SET,
+        async_bulk_set,
+        schema=BULK_SET_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+
+def _bulk_changes(data) -> dict:
+    """Return the API fields to write for the settings of a bulk_set call."""
+    changes = {}
+    if ATTR_TEMPERATURE in data:
+        changes["temperatureSet"] = data[ATTR_TEMPERATURE]
+        # Like climate.set_temperature, setting a temperature turns heating on
+        changes["powerOn"] = True
+    if ATTR_POWER in data:
+        changes["powerOn"] = data[ATTR_POWER]
+    if ATTR_PRESET_MODE in data:
+        changes["selectedProgram"] = data[ATTR_PRESET_MODE]
+    return changes
+
+
+async def _async_bulk_set_account(
+    coordinator: EbecoCoordinator,
+    targets: list[tuple[str, str]],
+    changes: dict,
+    max_concurrency: int | None,
+    results: dict,
+) -> None:
+    """Write changes to devices of one account, a bounded number at a time.
+
+    Writes in flight are limited to the request burst of the account, so a
+    bulk call neither waits on the rate limiter with dozens of requests nor
+    starves the polls of the account.
+    """
+    burst = coordinator.api.rate_limiter.burst
+    semaphore = asyncio.Semaphore(min(max_concurrency or burst, burst))
+    written = {}
+
+    async def async_write(entity_id, device_key) -> None:
+        state = coordinator.data.get(device_key)
+        if state is None:
+            results[entity_id] = {
+                "device_id": device_key,
+                "success": False,
+                "error": "Not found on the Ebeco account",
+            }
+            return
+        # Requests carry the id as the API reports it
+        device_id = state.id
+        device = coordinator.get_device(device_id)
+        async with semaphore:
+            try:
+                # The changes are already merged, so there is nothing to wait for
+                await device.async_apply(changes, delay=0)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.warning(
+                    "Unable to update Ebeco thermostat %s: %s", device_id, err
+                )
+                results[entity_id] = {
+                    "device_id": device_key,
+                    "success": False,
+                    "error": str(err) or type(err).__name__,
+                }
+                return
+        written[device_key] = await device.get_device()
+        results[entity_id] = {"device_id": device_key, "success": True}
+
+    await asyncio.gather(*(async_write(*target) for target in targets))
+    if written:
+        coordinator.async_note_write()
+        coordinator.async_set_devices_data(
+            {key: state for key, state in written.items() if state is not None}
+        )
@@ -0,0 +1,141 @@
+"""Measure the cost of decoding Ebeco API responses.
+
+Compares the old decode path (``json`` with a namedtuple per object for the
+login, the full device dicts kept for every poll) with the one used by
+``data_handler`` now (orjson when available, a compact snapshot per device).
+
+    python scripts/bench_decode.py --devices 1 50 500
+"""
+
+import argparse
+from collections import namedtuple
+import json
+from pathlib import Path
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "custom_components" / "ebeco"))
+
+import data_handler  # noqa: E402
+
+
+def device_payload(device_id):
+    """Return a device as sent by GetUserDevices, including unused fields."""
+    return {
+        "id": device_id,
+        "displayName": f"Thermostat {device_id}",
+        "building": {"id": 1, "name": "Home", "address": "Street 1", "zip": "12345"},
+        "powerOn": True,
+        "relayOn": device_id % 2 == 0,
+        "selectedProgram": "Manual",
+        "temperatureSet": 22,
+        "temperatureFloor": 21,
+        "temperatureFloorDecimals": 21.4,
+        "temperatureRoom": 20,
+        "temperatureRoomDecimals": 20.8,
+        "todaysOnMinutes": 134,
+        "installedEffect": 600,
+        "firmwareVersion": "2.4.17",
+        "macAddress": "00:11:22:33:44:55",
+        "lastConnected": "2024-01-01T12:00:00Z",
+        "timeZone": "W. Europe Standard Time",
+        "hasError": False,
+        "errorMessage": None,
+        "remoteInput": False,
+        "childLock": False,
+        "sensorMode": "FloorAndRoom",
+        "temperatureLimitFloorMax": 35,
+        "temperatureLimitFloorMin": 5,
+        "weekProgram": [
+            {"day": day, "periods": [{"start": "06:00", "end": "22:00", "temp": 22}]}
+            for day in range(7)
+        ],
+    }
+
+
+def response_body(devices):
+    return json.dumps(
+        {"result": [device_payload(i) for i in range(devices)], "success": True}
+    ).encode()
+
+
+LOGIN_BODY = json.dumps(
+    {
+        "result": {
+            "accessToken": "header.eyJleHAiOiAxNzAwMDAwMDAwfQ.signature",
+            "encryptedAccessToken": "x" * 200,
+            "expireInSeconds": 86400,
+            "userId": 1,
+        },
+        "success": True,
+    }
+).encode()
+
+
+def old_poll(body):
+    return json.loads(body)["result"]
+
+
+def new_poll(body):
+    return [
+        data_handler.EbecoDeviceState.from_api(d)
+        for d in data_handler._json_loads(body)["result"]
+    ]
+
+
+def old_login():
+    token_data = json.loads(
+        LOGIN_BODY.decode(),
+        object_hook=lambda d: namedtuple("X", d.keys(), rename=True)(*d.values()),
+    )
+    return token_data.result.accessToken
+
+
+def new_login():
+    return data_handler._json_loads(LOGIN_BODY)["result"]["accessToken"]
+
+
+def measure(func, *args, number):
+    seconds = min(timeit.repeat(lambda: func(*args), number=number, repeat=5))
+    return seconds / number * 1e6
+
+
+def retained(func, *args):
+    tracemalloc.start()
+    result = func(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    decoder = getattr(data_handler._json_loads, "__module__", None) or "orjson"
+    print(f"decoder: {decoder}")
+    print(
+        f"login: {measure(old_login, number=args.number * 10):8.1f} us -> "
+        f"{measure(new_login, number=args.number * 10):8.1f} us"
+    )
+    print(
+        f"{'devices':>8} {'old us':>10} {'new us':>10} {'old KiB':>10} {'new KiB':>10}"
+    )
+    for devices in args.devices:
+        body = response_body(devices)
+        number = max(args.number // max(devices // 10, 1), 5)
+        print(
+            f"{devices:>8} "
+            f"{measure(old_poll, body, number=number):>10.1f} "
+            f"{measure(new_poll, body, number=number):>10.1f} "
+            f"{retained(old_poll, body):>10.1f} "
+            f"{retained(new_poll, body):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Benchmark polling a fleet of thermostats against the local mock cloud.
+
+Starts ``mock_cloud.py`` in a separate process for every fleet size, so its CPU
+use does not count, and polls it through three paths:
+
+* ``api``: ``EbecoApi.fetch_user_devices`` once per poll.
+* ``device``: ``EbecoDevice.async_get`` for every device, the per device
+  polling the integration used before the account coordinator.
+* ``coordinator``: ``EbecoCoordinator.async_refresh``.
+
+The last two import the integration and are skipped when Home Assistant is not
+installed. Reports requests per poll, p50/p99 poll latency, logins per hour and
+CPU time per update. Use a ``--token-ttl`` shorter than the run, with polls
+spread out by ``--interval``, to see the cost of token refreshes.
+
+    python scripts/bench_fleet.py --devices 1 10 100 500 --polls 20 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+ROOT = Path(__file__).parent.parent
+try:
+    sys.path.insert(0, str(ROOT))
+    from custom_components.ebeco import data_handler
+    from custom_components.ebeco.coordinator import EbecoCoordinator
+    from custom_components.ebeco.ebeco_device import EbecoDevice
+    from homeassistant.core import HomeAssistant
+except ImportError:
+    sys.path.insert(0, str(ROOT / "custom_components" / "ebeco"))
+    import data_handler
+
+    HomeAssistant = None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _start_server(args, devices):
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(ROOT / "scripts" / "mock_cloud.py"),
+            f"--port={port}",
+            f"--devices={devices}",
+            f"--latency={args.latency}",
+            f"--jitter={args.jitter}",
+            f"--error-rate={args.error_rate}",
+            f"--throttle-rate={args.throttle_rate}",
+            f"--token-ttl={args.token_ttl}",
+            "--seed=1",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(f"{base_url}/mock/stats"):
+                    return process, base_url
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Mock cloud did not start")
+
+
+async def _server_stats(session, base_url, reset=False):
+    if reset:
+        async with session.post(f"{base_url}/mock/reset"):
+            return {}
+    async with session.get(f"{base_url}/mock/stats") as response:
+        return await response.json()
+
+
+def _new_api(args, base_url, websession):
+    if args.client_rate:
+        limiter = data_handler.EbecoRateLimiter(rate=args.client_rate)
+    else:
+        # Measure the cost of the requests, not the client side budget
+        limiter = data_handler.EbecoRateLimiter(rate=1e9, burst=1e9, user_reserve=0)
+    return data_handler.EbecoApi(
+        "bench@example.com",
+        "password",
+        websession=websession,
+        rate_limiter=limiter,
+        api_url=f"{base_url}/api",
+    )
+
+
+async def _run_scenario(args, name, base_url, websession, device_ids):
+    api = _new_api(args, base_url, websession)
+    hass = None
+    if name == "api":
+
+        async def poll():
+            await api.fetch_user_devices()
+
+    elif name == "device":
+        devices = [EbecoDevice(device_id, api) for device_id in device_ids]
+
+        async def poll():
+            await asyncio.gather(*(device.async_get() for device in devices))
+
+    else:
+        hass = HomeAssistant(tempfile.mkdtemp())
+        coordinator = EbecoCoordinator(hass, api)
+
+        async def poll():
+            await coordinator.async_refresh()
+            if not coordinator.last_update_success:
+                raise coordinator.last_exception
+
+    await _server_stats(websession, base_url, reset=True)
+    latencies = []
+    errors = 0
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    for _ in range(args.polls):
+        poll_started = time.perf_counter()
+        try:
+            await poll()
+        except Exception:  # noqa: BLE001
+            errors += 1
+        latencies.append(time.perf_counter() - poll_started)
+        if args.interval:
+            await asyncio.sleep(args.interval)
+    cpu = time.process_time() - cpu_started
+    elapsed = time.monotonic() - started
+    stats = await _server_stats(websession, base_url)
+    api.close()
+    if hass is not None:
+        await hass.async_stop(force=True)
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else None
+    return {
+        "scenario": name,
+        "devices": len(device_ids),
+        "polls": args.polls,
+        "errors": errors,
+        "requests_per_poll": stats.get("requests", 0) / args.polls,
+        "p50_ms": (quantiles[49] if quantiles else latencies[0]) * 1000,
+        "p99_ms": (quantiles[98] if quantiles else latencies[0]) * 1000,
+        # The first login of a fresh client is not part of the steady state
+        "logins_per_hour": max(stats.get("logins", 0) - 1, 0) / elapsed * 3600,
+        "cpu_ms_per_update": cpu / args.polls * 1000,
+        "rate_limited": stats.get("status.429", 0),
+    }
+
+
+async def _run(args):
+    scenarios = ["api"]
+    if HomeAssistant is not None:
+        scenarios += ["device", "coordinator"]
+    else:
+        print("Home Assistant is not installed, only the api scenario is run")
+
+    results = []
+    for devices in args.devices:
+        process, base_url = await _start_server(args, devices)
+        try:
+            async with aiohttp.ClientSession() as websession:
+                device_ids = list(range(1000, 1000 + devices))
+                for name in scenarios:
+                    results.append(
+                        await _run_scenario(
+                            args, name, base_url, websession, device_ids
+                        )
+                    )
+                    _print_result(results[-1], header=len(results) == 1)
+        finally:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+def _print_result(result, header=False):
+    if header:
+        print(
+            f"{'scenario':<12}{'devices':>8}{'req/poll':>10}{'p50 ms':>10}"
+            f"{'p99 ms':>10}{'logins/h':>10}{'cpu ms':>10}{'errors':>8}"
+        )
+    print(
+        f"{result['scenario']:<12}{result['devices']:>8}"
+        f"{result['requests_per_poll']:>10.1f}{result['p50_ms']:>10.1f}"
+        f"{result['p99_ms']:>10.1f}{result['logins_per_hour']:>10.0f}"
+        f"{result['cpu_ms_per_update']:>10.2f}{result['errors']:>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument(
+        "--interval", type=float, default=0.0, help="seconds between polls"
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=int, default=3600)
+    parser.add_argument(
+        "--client-rate",
+        type=float,
+        default=0,
+        help="requests per second allowed by the client limiter, 0 for no limit",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
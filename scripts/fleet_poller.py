@@ -0,0 +1,356 @@
+"""Poll Ebeco accounts on a schedule and stream device samples, without Home Assistant.
+
+Every account gets its own ``EbecoApi``, with its own token and request
+budget, and all accounts are polled concurrently at every tick of
+``--interval``. Each device on an account becomes one sample per poll, a flat
+record of the poll time, the account and the fields of ``EbecoDeviceState``,
+written as NDJSON, CSV or Parquet (when pyarrow is installed).
+
+Samples pass through a bounded queue to a writer that writes them in batches
+from an executor, so memory use stays flat however long the poller runs. A
+slow sink holds back the polls instead of piling up samples.
+
+Accounts are given with ``--username`` and ``--password`` (or the
+EBECO_USERNAME and EBECO_PASSWORD environment variables), or as a JSON file
+with a list of objects with ``username``, ``password`` and optionally
+``label`` and ``api_url``::
+
+    python scripts/fleet_poller.py --accounts accounts.json --interval 60 \\
+        --format csv --output samples.csv
+
+``--mock-devices`` polls a ``mock_cloud.py`` fleet started in the same process
+instead, to try the poller out without an account::
+
+    python scripts/fleet_poller.py --mock-devices 500 --interval 5 --polls 3
+"""
+
+import argparse
+import asyncio
+import csv
+from dataclasses import fields
+import datetime
+import json
+import os
+from pathlib import Path
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "custom_components" / "ebeco"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import data_handler  # noqa: E402
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ("ndjson", "csv", "parquet")
+COLUMNS = (
+    "time",
+    "account",
+    *(field.name for field in fields(data_handler.EbecoDeviceState)),
+)
+
+
+class NdjsonSink:
+    """Write samples as one JSON object per line."""
+
+    def __init__(self, output) -> None:
+        self._file = (
+            sys.stdout if output == "-" else open(output, "a", encoding="utf-8")
+        )
+
+    def write(self, samples) -> None:
+        self._file.write(
+            "".join(
+                json.dumps(sample, separators=(",", ":")) + "\n" for sample in samples
+            )
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class CsvSink:
+    """Write samples as CSV rows, with a header unless appending to a file."""
+
+    def __init__(self, output) -> None:
+        header = (
+            output == "-" or not os.path.exists(output) or not os.path.getsize(output)
+        )
+        self._file = (
+            sys.stdout
+            if output == "-"
+            else open(output, "a", encoding="utf-8", newline="")
+        )
+        self._writer = csv.DictWriter(self._file, COLUMNS)
+        if header:
+            self._writer.writeheader()
+
+    def write(self, samples) -> None:
+        self._writer.writerows(samples)
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class ParquetSink:
+    """Write samples to a Parquet file, one row group per batch."""
+
+    def __init__(self, output) -> None:
+        self._schema = pyarrow.schema(
+            [
+                ("time", pyarrow.timestamp("ms", tz="UTC")),
+                ("account", pyarrow.string()),
+                ("id", pyarrow.int64()),
+                ("display_name", pyarrow.string()),
+                ("building", pyarrow.string()),
+                ("power_on", pyarrow.bool_()),
+                ("relay_on", pyarrow.bool_()),
+                ("selected_program", pyarrow.string()),
+                ("temperature_set", pyarrow.float64()),
+                ("temperature_floor", pyarrow.float64()),
+                ("temperature_room", pyarrow.float64()),
+                ("todays_on_minutes", pyarrow.int64()),
+                ("installed_effect", pyarrow.int64()),
+            ]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(output, self._schema)
+
+    def write(self, samples) -> None:
+        rows = [
+            {**sample, "time": datetime.datetime.fromisoformat(sample["time"])}
+            for sample in samples
+        ]
+        self._writer.write_table(pyarrow.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+SINKS = {"ndjson": NdjsonSink, "csv": CsvSink, "parquet": ParquetSink}
+
+
+class FleetPoller:
+    """Poll accounts concurrently and hand their samples to a sink."""
+
+    def __init__(self, accounts, sink, interval, polls, queue_size, batch_size):
+        """Init the poller with a list of (label, EbecoApi) pairs."""
+        self._accounts = accounts
+        self._sink = sink
+        self._interval = interval
+        self._polls = polls
+        self._batch_size = batch_size
+        self._queue = asyncio.Queue(queue_size)
+        self.polls = 0
+        self.errors = 0
+        self.samples = 0
+        self.skipped_ticks = 0
+
+    async def async_run(self) -> None:
+        """Poll until the number of polls is reached, or forever if it is 0."""
+        polls = asyncio.gather(
+            *(self._async_poll_account(label, api) for label, api in self._accounts)
+        )
+        writer = asyncio.create_task(self._async_write())
+        try:
+            await asyncio.wait((polls, writer), return_when=asyncio.FIRST_COMPLETED)
+            if writer.done():
+                # The sink failed, there is no point in polling on
+                writer.result()
+            await polls
+            # Let the writer write what is left and stop
+            await self._queue.put(None)
+            await writer
+        finally:
+            polls.cancel()
+            writer.cancel()
+            await asyncio.gather(polls, writer, return_exceptions=True)
+
+    async def _async_poll_account(self, label, api) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        tick = 0
+        while not self._polls or tick < self._polls:
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat(
+                timespec="milliseconds"
+            )
+            try:
+                devices = await api.fetch_user_devices()
+            except Exception as err:  # noqa: BLE001
+                self.errors += 1
+                print(f"{label}: {err!r}", file=sys.stderr)
+            else:
+                if devices is None:
+                    self.errors += 1
+                    print(f"{label}: no data received", file=sys.stderr)
+                    devices = ()
+                self.polls += 1
+                for device in devices:
+                    # Waits while the queue is full, so a slow sink holds back
+                    # the polls instead of growing the queue
+                    await self._queue.put(
+                        {"time": now, "account": label, **device.as_dict()}
+                    )
+
+            # Stick to the schedule, skipping ticks a slow poll ran into
+            tick += 1
+            next_tick = started + tick * self._interval
+            if loop.time() > next_tick:
+                missed = int((loop.time() - next_tick) // self._interval) + 1
+                self.skipped_ticks += missed
+                tick += missed
+                next_tick = started + tick * self._interval
+            if not self._polls or tick < self._polls:
+                await asyncio.sleep(next_tick - loop.time())
+
+    async def _async_write(self) -> None:
+        """Write queued samples in batches until the queue ends with None."""
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            batch = []
+            sample = await self._queue.get()
+            while sample is not None:
+                batch.append(sample)
+                if len(batch) >= self._batch_size or self._queue.empty():
+                    break
+                sample = self._queue.get_nowait()
+            done = sample is None
+            if batch:
+                await loop.run_in_executor(None, self._sink.write, batch)
+                self.samples += len(batch)
+
+
+def _load_accounts(args):
+    if args.accounts:
+        with open(args.accounts, encoding="utf-8") as file:
+            accounts = json.load(file)
+    elif args.username and args.password:
+        accounts = [{"username": args.username, "password": args.password}]
+    else:
+        return None
+    return [
+        {
+            "label": account.get("label", account["username"]),
+            "username": account["username"],
+            "password": account["password"],
+            "api_url": account.get("api_url", args.api_url),
+        }
+        for account in accounts
+    ]
+
+
+async def _async_main(args, accounts) -> None:
+    cloud = None
+    if args.mock_devices:
+        from mock_cloud import MockEbecoCloud
+
+        cloud = MockEbecoCloud(devices=args.mock_devices)
+        api_url = await cloud.start()
+        accounts = [
+            {
+                "label": "mock",
+                "username": "mock",
+                "password": "mock",
+                "api_url": api_url,
+            }
+        ]
+
+    # One pool for every account, they all talk to the same host
+    websession = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=args.connections,
+            ttl_dns_cache=data_handler.CONNECTOR_DNS_CACHE_SECONDS,
+            keepalive_timeout=data_handler.CONNECTOR_KEEPALIVE_SECONDS,
+        )
+    )
+    apis = [
+        (
+            account["label"],
+            data_handler.EbecoApi(
+                account["username"],
+                account["password"],
+                websession=websession,
+                api_url=account["api_url"],
+            ),
+        )
+        for account in accounts
+    ]
+    sink = SINKS[args.format](args.output)
+    poller = FleetPoller(
+        apis, sink, args.interval, args.polls, args.queue_size, args.batch_size
+    )
+    started = time.monotonic()
+    try:
+        await poller.async_run()
+    finally:
+        sink.close()
+        for _, api in apis:
+            await api.async_close()
+        await websession.close()
+        if cloud is not None:
+            await cloud.stop()
+        print(
+            f"{poller.polls} polls of {len(apis)} accounts, {poller.samples} samples,"
+            f" {poller.errors} errors, {poller.skipped_ticks} skipped ticks"
+            f" in {time.monotonic() - started:.1f} s",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", help="JSON file with the accounts to poll")
+    parser.add_argument("--username", default=os.environ.get("EBECO_USERNAME"))
+    parser.add_argument("--password", default=os.environ.get("EBECO_PASSWORD"))
+    parser.add_argument("--api-url", default=data_handler.API_URL)
+    parser.add_argument(
+        "--mock-devices",
+        type=int,
+        default=0,
+        help="poll a local mock cloud with this many devices instead",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=60, help="seconds between polls"
+    )
+    parser.add_argument(
+        "--polls", type=int, default=0, help="polls per account, 0 to run until stopped"
+    )
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--output", default="-", help="file to write, - for stdout")
+    parser.add_argument(
+        "--connections", type=int, default=32, help="connections shared by all accounts"
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=10000, help="samples waiting to be written"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="samples written at once"
+    )
+    args = parser.parse_args()
+
+    accounts = _load_accounts(args)
+    if not accounts and not args.mock_devices:
+        parser.error("give --accounts, --username and --password, or --mock-devices")
+    if args.format == "parquet":
+        if pyarrow is None:
+            parser.error("writing Parquet needs pyarrow")
+        if args.output == "-":
+            parser.error("Parquet can only be written to a file")
+    try:
+        asyncio.run(_async_main(args, accounts))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Local stand-in for the Ebeco cloud API.
+
+Implements the endpoints used by the integration (TokenAuth, GetUserDevices,
+GetUserDeviceById and UpdateUserDevice) for a simulated fleet of thermostats,
+with configurable latency, errors and rate limiting. Point ``EbecoApi`` at it
+with ``api_url=server.api_url``.
+
+    python scripts/mock_cloud.py --devices 100 --latency 0.05 --throttle-rate 0.01
+
+Request counters are served as JSON on ``/mock/stats`` and cleared with a POST
+to ``/mock/reset``.
+"""
+
+import argparse
+import asyncio
+import base64
+from collections import Counter
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+
+class MockEbecoCloud:
+    """Simulated Ebeco cloud serving a fleet of thermostats."""
+
+    def __init__(
+        self,
+        devices=10,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        rate_limit=0.0,
+        retry_after=1,
+        token_ttl=3600,
+        change_rate=0.05,
+        seed=None,
+    ) -> None:
+        """Init the simulated cloud.
+
+        latency and jitter are in seconds, error_rate and throttle_rate are the
+        share of requests answered with a 500 and a 429, rate_limit is the
+        number of requests per second accepted before answering 429 and
+        change_rate is the chance a device changes between two polls.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self.change_rate = change_rate
+        self._random = random.Random(seed)
+        self._tokens = {}
+        self._bucket = rate_limit
+        self._bucket_updated = time.monotonic()
+        self.stats = Counter()
+        self.devices = {
+            device_id: self._new_device(device_id)
+            for device_id in range(1000, 1000 + devices)
+        }
+        self.app = web.Application(middlewares=[self._middleware])
+        self.app.router.add_post("/api/TokenAuth", self._token_auth)
+        self.app.router.add_get(
+            "/api/services/app/Devices/GetUserDevices/", self._get_user_devices
+        )
+        self.app.router.add_get(
+            "/api/services/app/Devices/GetUserDeviceById/", self._get_user_device
+        )
+        self.app.router.add_put(
+            "/api/services/app/Devices/UpdateUserDevice", self._update_user_device
+        )
+        self.app.router.add_get("/mock/stats", self._get_stats)
+        self.app.router.add_post("/mock/reset", self._reset_stats)
+        self._runner = None
+        self.api_url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the URL to use as api_url."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.api_url = f"http://{host}:{port}/api"
+        return self.api_url
+
+    async def stop(self):
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _new_device(self, device_id):
+        floor = round(self._random.uniform(18, 26), 1)
+        return {
+            "id": device_id,
+            "displayName": f"Thermostat {device_id}",
+            "building": {"id": 1, "name": "Mock building"},
+            "powerOn": True,
+            "relayOn": self._random.random() < 0.3,
+            "selectedProgram": "Manual",
+            "temperatureSet": 22,
+            "temperatureFloor": int(floor),
+            "temperatureFloorDecimals": floor,
+            "temperatureRoom": int(floor) - 1,
+            "temperatureRoomDecimals": round(floor - 1.2, 1),
+            "todaysOnMinutes": self._random.randrange(0, 600),
+            "installedEffect": self._random.choice((400, 600, 800, 1200)),
+            "firmwareVersion": "2.4.17",
+            "macAddress": "00:11:22:33:44:55",
+            "hasError": False,
+        }
+
+    def _advance(self):
+        """Let some devices change between polls."""
+        for device in self.devices.values():
+            if self._random.random() >= self.change_rate:
+                continue
+            device["relayOn"] = not device["relayOn"]
+            floor = round(
+                device["temperatureFloorDecimals"]
+                + (0.2 if device["relayOn"] else -0.1),
+                1,
+            )
+            device["temperatureFloorDecimals"] = floor
+            device["temperatureFloor"] = int(floor)
+            if device["relayOn"]:
+                device["todaysOnMinutes"] += 1
+
+    def _rate_limited(self):
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            return True
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        self._bucket = min(
+            self.rate_limit,
+            self._bucket + (now - self._bucket_updated) * self.rate_limit,
+        )
+        self._bucket_updated = now
+        if self._bucket < 1:
+            return True
+        self._bucket -= 1
+        return False
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if request.path.startswith("/mock/"):
+            return await handler(request)
+
+        endpoint = request.path.rstrip("/").rsplit("/", 1)[-1]
+        self.stats["requests"] += 1
+        self.stats[f"requests.{endpoint}"] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(
+                max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0)
+            )
+
+        if self._rate_limited():
+            self.stats["status.429"] += 1
+            return web.json_response(
+                {"success": False},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats["status.500"] += 1
+            return web.json_response({"success": False}, status=500)
+
+        if endpoint != "TokenAuth":
+            token = request.headers.get("Authorization", "")[len("Bearer ") :]
+            if self._tokens.get(token, 0) < time.time():
+                self.stats["status.401"] += 1
+                return web.json_response({"success": False}, status=401)
+
+        response = await handler(request)
+        self.stats[f"status.{response.status}"] += 1
+        self.stats["bytes_sent"] += len(response.body or b"")
+        return response
+
+    async def _token_auth(self, request):
+        credentials = await request.json()
+        if not credentials.get("userNameOrEmailAddress"):
+            return web.json_response({"success": False}, status=400)
+        expires_at = int(time.time() + self.token_ttl)
+        token = ".".join(
+            (_b64({"alg": "HS256"}), _b64({"exp": expires_at}), uuid.uuid4().hex)
+        )
+        self._tokens[token] = expires_at
+        self.stats["logins"] += 1
+        return web.json_response(
+            {
+                "result": {
+                    "accessToken": token,
+                    "expireInSeconds": self.token_ttl,
+                    "userId": 1,
+                },
+                "success": True,
+            }
+        )
+
+    async def _get_user_devices(self, request):
+        self._advance()
+        return web.json_response(
+            {"result": list(self.devices.values()), "success": True}
+        )
+
+    async def _get_user_device(self, request):
+        device = self.devices.get(int(request.query.get("id", -1)))
+        if device is None:
+            return web.json_response({"success": False}, status=404)
+        return web.json_response({"result": device, "success": True})
+
+    async def _update_user_device(self, request):
+        changes = await request.json()
+        device = self.devices.get(int(changes.pop("id", -1)))
+        if device is None:
+            return web.json_response({"success": False}, status=404)
+        device.update(
+            (field, value)
+            for field, value in changes.items()
+            if field in ("powerOn", "selectedProgram", "temperatureSet")
+        )
+        self.stats["updates"] += 1
+        return web.json_response({"result": None, "success": True})
+
+    async def _get_stats(self, request):
+        return web.json_response(dict(self.stats))
+
+    async def _reset_stats(self, request):
+        self.stats.clear()
+        return web.json_response({})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--token-ttl", type=int, default=3600)
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    cloud = MockEbecoCloud(
+        devices=args.devices,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        token_ttl=args.token_ttl,
+        change_rate=args.change_rate,
+        seed=args.seed,
+    )
+    print(f"Serving {args.devices} devices on http://{args.host}:{args.port}/api")
+    web.run_app(cloud.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Record the Ebeco API traffic of a polling session to a cassette.
+
+Logs in with the given account, or the EBECO_USERNAME and EBECO_PASSWORD
+environment variables, and polls the account and every device on it the way
+the integration does. Credentials, tokens and names are redacted in the
+cassette, see ``cassette.py``.
+
+    python scripts/record_cassette.py --polls 30 --interval 60 traffic.ndjson
+
+Point ``--api-url`` at ``mock_cloud.py`` to record a cassette without an
+account.
+"""
+
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "custom_components" / "ebeco"))
+
+from cassette import EbecoCassetteRecorder  # noqa: E402
+import data_handler  # noqa: E402
+
+
+async def _record(args):
+    recorder = EbecoCassetteRecorder(args.cassette)
+    api = data_handler.EbecoApi(
+        args.username, args.password, api_url=args.api_url, recorder=recorder
+    )
+    try:
+        for poll in range(args.polls):
+            if poll:
+                await asyncio.sleep(args.interval)
+            try:
+                devices = await api.fetch_user_devices()
+                if args.device_calls and devices:
+                    await asyncio.gather(
+                        *(api.fetch_user_device(device.id) for device in devices)
+                    )
+            except Exception as err:  # noqa: BLE001
+                # Failures are part of the traffic worth recording
+                print(f"poll {poll + 1}: {err!r}")
+            else:
+                print(f"poll {poll + 1}: {len(devices or ())} devices")
+    finally:
+        await api.async_close()
+        await recorder.async_close()
+    print(f"Wrote {args.cassette}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cassette", help="file to write the cassette to")
+    parser.add_argument("--username", default=os.environ.get("EBECO_USERNAME"))
+    parser.add_argument("--password", default=os.environ.get("EBECO_PASSWORD"))
+    parser.add_argument("--api-url", default=data_handler.API_URL)
+    parser.add_argument("--polls", type=int, default=10)
+    parser.add_argument(
+        "--interval", type=float, default=60, help="seconds between polls"
+    )
+    parser.add_argument(
+        "--device-calls",
+        action="store_true",
+        help="also fetch every device on its own, as EbecoDevice.async_get does",
+    )
+    args = parser.parse_args()
+    if not args.username or not args.password:
+        parser.error("an Ebeco username and password are needed")
+    asyncio.run(_record(args))
+
+
+if __name__ == "__main__":
+    main()
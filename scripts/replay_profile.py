@@ -0,0 +1,173 @@
+"""Profile the data path by replaying a recorded cassette.
+
+Feeds the responses recorded by ``record_cassette.py`` back through
+``EbecoApi``, without network access, and reports CPU time and allocations per
+call along with the functions that took the most time. With Home Assistant
+installed ``EbecoDevice.async_get`` is profiled as well. CPU time, allocations
+and the profile are measured in separate passes.
+
+    python scripts/replay_profile.py traffic.ndjson --calls 2000 --json before.json
+
+Run it on two checkouts with the same cassette to compare versions. Use
+``--speed`` to also replay the recorded response times, sped up by that
+factor, e.g. to reproduce 429 bursts and slow responses, and ``--paced`` to
+hold every response until the time it was recorded at as well.
+"""
+
+import argparse
+import asyncio
+import cProfile
+import io
+import json
+from pathlib import Path
+import pstats
+import sys
+import time
+import tracemalloc
+
+ROOT = Path(__file__).parent.parent
+try:
+    sys.path.insert(0, str(ROOT))
+    from custom_components.ebeco import data_handler
+    from custom_components.ebeco.cassette import EbecoReplaySession, load_cassette
+    from custom_components.ebeco.ebeco_device import EbecoDevice
+except ImportError:
+    sys.path.insert(0, str(ROOT / "custom_components" / "ebeco"))
+    from cassette import EbecoReplaySession, load_cassette
+    import data_handler
+
+    EbecoDevice = None
+
+
+def _device_ids(lines):
+    """Return the ids of the devices in the cassette."""
+    for line in lines:
+        if line["path"].startswith("/services/app/Devices/GetUserDevices") and (
+            line["body"] and line["body"].get("result")
+        ):
+            return [device["id"] for device in line["body"]["result"]]
+    return []
+
+
+def _new_api(lines, speed, paced):
+    return data_handler.EbecoApi(
+        "replay@example.com",
+        "password",
+        websession=EbecoReplaySession(lines, speed=speed, paced=paced),
+        rate_limiter=data_handler.EbecoRateLimiter(rate=1e9, burst=1e9, user_reserve=0),
+    )
+
+
+async def _calls(call, calls):
+    errors = 0
+    for _ in range(calls):
+        try:
+            await call()
+        except Exception:  # noqa: BLE001
+            errors += 1
+    return errors
+
+
+async def _profile(name, call, calls, profile):
+    # Log in and warm up outside the measurement
+    await _calls(call, 1)
+
+    # Separate passes, as tracing allocations and profiling both slow the
+    # code down
+    started = time.process_time()
+    errors = await _calls(call, calls)
+    cpu = time.process_time() - started
+
+    tracemalloc.start()
+    await _calls(call, calls)
+    _, peak = tracemalloc.get_traced_memory()
+    retained = sum(
+        stat.size for stat in tracemalloc.take_snapshot().statistics("filename")
+    )
+    tracemalloc.stop()
+
+    stats = None
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        await _calls(call, calls)
+        profiler.disable()
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(15)
+        stats = stream.getvalue()
+
+    return {
+        "scenario": name,
+        "calls": calls,
+        "errors": errors,
+        "cpu_us_per_call": cpu / calls * 1e6,
+        "peak_kib": peak / 1024,
+        "retained_kib": retained / 1024,
+        "profile": stats,
+    }
+
+
+async def _run(args):
+    lines = load_cassette(args.cassette)
+    device_ids = _device_ids(lines)
+    results = []
+
+    api = _new_api(lines, args.speed, args.paced)
+    results.append(
+        await _profile(
+            "fetch_user_devices",
+            api.fetch_user_devices,
+            args.calls,
+            args.profile,
+        )
+    )
+    api.close()
+
+    if EbecoDevice is None:
+        print("Home Assistant is not installed, EbecoDevice.async_get is skipped")
+    elif not device_ids:
+        print("No devices in the cassette, EbecoDevice.async_get is skipped")
+    else:
+        api = _new_api(lines, args.speed, args.paced)
+        device = EbecoDevice(device_ids[0], api)
+        results.append(
+            await _profile(
+                "EbecoDevice.async_get", device.async_get, args.calls, args.profile
+            )
+        )
+        api.close()
+
+    for result in results:
+        print(
+            f"{result['scenario']}: {result['cpu_us_per_call']:.1f} us/call, "
+            f"peak {result['peak_kib']:.1f} KiB, "
+            f"retained {result['retained_kib']:.1f} KiB, {result['errors']} errors"
+        )
+        if result["profile"]:
+            print(result["profile"])
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cassette")
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="replay recorded response times this many times faster, 0 to skip them",
+    )
+    parser.add_argument(
+        "--paced",
+        action="store_true",
+        help="with --speed, replay the recorded times of the requests as well",
+    )
+    parser.add_argument("--profile", action="store_true", help="print cProfile stats")
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()